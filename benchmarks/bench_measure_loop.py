@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк цикла измерения MeasureProcessing._run_single_process.
+
+Прибор и МПП заменяются локальными симуляторами (SimulatedKeithley2600 и
+MppEmulator), задержки которых задаются параметрами. Для каждой комбинации
+режима, размера развертки и числа циклов считается скорость (точек/с),
+задержка точки (p50/p95/max) и разбивка времени точки по стадиям:
+установка уровня, пауза установления, чтение Keithley, запуск и чтение
+МПП по Modbus, запись результатов и обновление графика.
+
+Результаты сохраняются в JSON; --compare печатает сравнение с прошлым файлом.
+
+    python benchmarks/bench_measure_loop.py --sizes 10 100 --loops 1 3
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Iterator
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+src_path = Path(__file__).resolve().parent.parent
+sys.path.append(str(src_path))
+
+from loguru import logger  # noqa: E402
+
+from model.keithly_script import CalibrationSession, MatplotlibRealtimePlot, MeasureProcessing, MPModel  # noqa: E402
+from src.keithley_sim import SimulatedKeithley2600, SimKeithleySettings  # noqa: E402
+from src.keithley_tsp import TspSweepEngine  # noqa: E402
+from src.mpp_emulator import MppEmulator, MppEmulatorSettings  # noqa: E402
+
+MODES = ("host", "tsp", "calibrate")
+STAGES = (
+    "keithley_set",
+    "settle",
+    "keithley_read",
+    "tsp_sweep",
+    "modbus_force",
+    "modbus_read",
+    "persist",
+    "plot",
+)
+BENCH_TASK = "bench_process"
+
+
+class StageProbe:
+    """Суммарное время и число вызовов по стадиям."""
+
+    def __init__(self) -> None:
+        self.total_s: dict[str, float] = defaultdict(float)
+        self.calls: dict[str, int] = defaultdict(int)
+        self.row_times: list[float] = []
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.total_s[stage] += seconds
+        self.calls[stage] += 1
+
+    def wrap_async(self, stage: str, func: Callable) -> Callable:
+        async def _timed(*args: Any, **kwargs: Any) -> Any:
+            t0 = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - t0)
+
+        return _timed
+
+    def wrap_sync(self, stage: str, func: Callable) -> Callable:
+        def _timed(*args: Any, **kwargs: Any) -> Any:
+            t0 = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - t0)
+
+        return _timed
+
+
+@contextlib.contextmanager
+def _patched(target: Any, name: str, value: Any) -> Iterator[None]:
+    original = getattr(target, name)
+    setattr(target, name, value)
+    try:
+        yield
+    finally:
+        setattr(target, name, original)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _process_config(mode: str, size: int, loops: int, args: argparse.Namespace, com: str) -> MPModel:
+    measure: dict[str, Any] = {
+        "linspace_mode": {"vg_start": 0.0, "vg_stop": 3.0, "vg_step": size, "step_delay_s": args.step_delay_ms / 1e3},
+        "pipeline": args.pipeline,
+    }
+    if mode == "tsp":
+        measure["sweep_engine"] = "tsp"
+    conf: dict[str, Any] = {
+        "name": f"bench_{mode}_{size}x{loops}",
+        "calibrate_mode": mode == "calibrate",
+        "measure_settings": measure,
+        "current_limit": 0.01,
+        "loop": loops > 1,
+        "save_table": True,
+        "save_plot": args.plot,
+    }
+    if mode == "calibrate":
+        conf["modbus_settings"] = {"id": 14, "bodrate": args.baud, "com": com}
+    return MPModel.model_validate(conf)
+
+
+async def _run_case(mp: MeasureProcessing, process: MPModel, loops: int, probe: StageProbe) -> tuple[float, float]:
+    cycles = 0
+    measure_cycle = mp._measure_cycle
+
+    async def _counted_cycle(*a: Any, **kw: Any) -> Any:
+        nonlocal cycles
+        async for point in measure_cycle(*a, **kw):
+            yield point
+        cycles += 1
+        if cycles >= loops:
+            process.loop = False
+
+    make_writers = mp._make_writers
+
+    def _probed_writers(*a: Any, **kw: Any) -> Any:
+        writers = make_writers(*a, **kw)
+        csv_write = writers[0].write
+
+        def _write_row(row: Any) -> None:
+            csv_write(row)
+            probe.row_times.append(time.perf_counter())
+
+        writers[0].write = probe.wrap_sync("persist", _write_row)
+        for writer in writers[1:]:
+            writer.write = probe.wrap_sync("persist", writer.write)
+        return writers
+
+    mp._measure_cycle = _counted_cycle  # type: ignore[method-assign]
+    mp._make_writers = _probed_writers  # type: ignore[method-assign]
+    mp._keithley_set_voltage = probe.wrap_async("keithley_set", mp._keithley_set_voltage)  # type: ignore[method-assign]
+    mp._read_keithley_current_sync = probe.wrap_sync("keithley_read", mp._read_keithley_current_sync)  # type: ignore[method-assign]
+
+    sleep = asyncio.sleep
+
+    async def _probed_sleep(delay: float, *a: Any, **kw: Any) -> Any:
+        # пауза установления - только sleep самой задачи процесса, не отрисовки
+        task = asyncio.current_task()
+        if delay > 0 and task is not None and task.get_name() == BENCH_TASK:
+            return await probe.wrap_async("settle", sleep)(delay, *a, **kw)
+        return await sleep(delay, *a, **kw)
+
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(_patched(asyncio, "sleep", _probed_sleep))
+        stack.enter_context(_patched(CalibrationSession, "arm", probe.wrap_async("modbus_force", CalibrationSession.arm)))
+        stack.enter_context(
+            _patched(CalibrationSession, "read_peak", probe.wrap_async("modbus_read", CalibrationSession.read_peak))
+        )
+        stack.enter_context(_patched(TspSweepEngine, "run", probe.wrap_sync("tsp_sweep", TspSweepEngine.run)))
+        stack.enter_context(
+            _patched(MatplotlibRealtimePlot, "update", probe.wrap_async("plot", MatplotlibRealtimePlot.update))
+        )
+        t0 = time.perf_counter()
+        task = asyncio.create_task(mp._run_single_process("bench", process), name=BENCH_TASK)
+        await task
+        t_end = time.perf_counter()
+        await mp._close_modbus()
+    return t0, t_end
+
+
+def _percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def run_case(mode: str, size: int, loops: int, args: argparse.Namespace) -> dict[str, Any]:
+    k = SimulatedKeithley2600(
+        settings=SimKeithleySettings(
+            latency_s=args.keithley_latency_ms / 1e3, load_ohm=1000.0, time_scale=1.0, seed=1
+        )
+    )
+    emulator = None
+    com = ""
+    if mode == "calibrate":
+        settings = MppEmulatorSettings(latency_s=args.mpp_latency_ms / 1e3, baudrate=args.baud, seed=1)
+        emulator = MppEmulator(port=_free_port(), settings=settings, input_source=lambda: k.smua.output_voltage)
+        emulator.start()
+        com = emulator.url
+    probe = StageProbe()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            mp = MeasureProcessing(k, output_root=tmp, live_plot=False)
+            mp.output_dir = Path(tmp)
+            process = _process_config(mode, size, loops, args, com)
+            t0, t_end = asyncio.run(_run_case(mp, process, loops, probe))
+    finally:
+        if emulator is not None:
+            emulator.stop()
+
+    points = len(probe.row_times)
+    elapsed = t_end - t0
+    rows = probe.row_times
+    intervals = [b - a for a, b in zip(rows, rows[1:])]
+    # подготовка (источник, график, писатели) и завершение (сброс, PNG) - отдельно от точек
+    setup_s = rows[0] - t0 if rows else elapsed
+    teardown_s = t_end - rows[-1] if rows else 0.0
+    point_s = (elapsed - setup_s - teardown_s) / (points - 1) if points > 1 else elapsed
+    per_point = {stage: probe.total_s[stage] / points * 1e3 if points else 0.0 for stage in STAGES}
+    accounted = sum(per_point.values())
+    return {
+        "mode": mode,
+        "size": size,
+        "loops": loops,
+        "points": points,
+        "elapsed_s": elapsed,
+        "setup_s": setup_s,
+        "teardown_s": teardown_s,
+        "points_per_s": points / elapsed if elapsed > 0 else 0.0,
+        "steady_points_per_s": 1.0 / point_s if point_s > 0 else 0.0,
+        "point_ms": {
+            "mean": point_s * 1e3,
+            "p50": _percentile(intervals, 0.5) * 1e3,
+            "p95": _percentile(intervals, 0.95) * 1e3,
+            "max": max(intervals, default=0.0) * 1e3,
+        },
+        "stages_ms_per_point": per_point,
+        "stage_calls": dict(probe.calls),
+        "other_ms_per_point": max(point_s * 1e3 - accounted, 0.0),
+        "keithley_commands": k.commands,
+        "modbus_transactions": emulator.transactions if emulator is not None else 0,
+    }
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=src_path, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def _case_key(result: dict[str, Any]) -> tuple:
+    return result["mode"], result["size"], result["loops"]
+
+
+def compare(current: dict[str, Any], baseline_path: Path) -> None:
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+    base = {_case_key(result): result for result in baseline["results"]}
+    print(f"\ncompare with {baseline_path} ({baseline['meta']['git']}):")
+    for result in current["results"]:
+        old = base.get(_case_key(result))
+        if old is None or not old["points_per_s"]:
+            continue
+        ratio = result["points_per_s"] / old["points_per_s"]
+        print(
+            f"  {result['mode']:>9} {result['size']:>5}x{result['loops']:<3} "
+            f"{old['points_per_s']:9.1f} -> {result['points_per_s']:9.1f} points/s ({ratio:5.2f}x)"
+        )
+
+
+def _print_result(result: dict[str, Any]) -> None:
+    stages = " ".join(
+        f"{stage}={ms:.2f}" for stage, ms in result["stages_ms_per_point"].items() if result["stage_calls"].get(stage)
+    )
+    print(
+        f"{result['mode']:>9} {result['size']:>5}x{result['loops']:<3} "
+        f"{result['points_per_s']:9.1f} points/s (steady {result['steady_points_per_s']:.1f}, "
+        f"setup {result['setup_s'] * 1e3:.0f} ms)  p50 {result['point_ms']['p50']:.2f} ms  "
+        f"p95 {result['point_ms']['p95']:.2f} ms  | ms/point: {stages} other={result['other_ms_per_point']:.2f}"
+    )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарк цикла измерения на симуляторах Keithley и МПП")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--sizes", nargs="+", type=int, default=[10, 100])
+    parser.add_argument("--loops", nargs="+", type=int, default=[1, 3])
+    parser.add_argument("--keithley-latency-ms", type=float, default=1.0, help="задержка команды Keithley")
+    parser.add_argument("--mpp-latency-ms", type=float, default=1.0, help="задержка обработки запроса МПП")
+    parser.add_argument("--baud", type=int, default=125000, help="скорость линии МПП")
+    parser.add_argument("--step-delay-ms", type=float, default=0.0, help="step_delay_s развертки")
+    parser.add_argument("--pipeline", action="store_true", help="конвейерный режим калибровки")
+    parser.add_argument("--plot", action="store_true", help="строить график (save_plot)")
+    parser.add_argument("--output", type=Path, help="файл JSON с результатами")
+    parser.add_argument("--compare", type=Path, help="сравнить с прошлым JSON")
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+    results = []
+    for mode in args.modes:
+        for size in args.sizes:
+            for loops in args.loops:
+                result = run_case(mode, size, loops, args)
+                _print_result(result)
+                results.append(result)
+
+    report = {
+        "meta": {
+            "git": _git_revision(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": {key: str(value) if isinstance(value, Path) else value for key, value in vars(args).items()},
+        },
+        "results": results,
+    }
+    output = args.output or src_path / "benchmarks" / "results" / f"measure_loop_{datetime.now():%Y%m%d_%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"\nsaved: {output}")
+    if args.compare is not None:
+        compare(report, args.compare)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
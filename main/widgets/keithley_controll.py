@@ -1,7 +1,11 @@
 import asyncio
 import sys
+import time
+from datetime import datetime
 from pathlib import Path
+from typing import AsyncIterator
 
+import numpy as np
 import qasync
 import qtmodern.styles
 from PyQt6 import QtWidgets
@@ -17,7 +21,16 @@ sys.path.append(str(modules_path))
 
 from modules.serial.main_serial_dialog_tcp import SerialConnect  # noqa: E402
 from src.async_task_manager import AsyncTaskManager  # noqa: E402
+from src.keithley_io import KeithleyIOWorker, keithley_io  # noqa: E402
+from src.keithley_pulse import PulseTrain, TspPulseEngine  # noqa: E402
+from src.keithley_sim import is_sim_resource, open_keithley  # noqa: E402
 from src.log_config import log_init  # noqa: E402
+from src.pars_util import pars_16b  # noqa: E402
+from src.pulse_pipeline import OVERFLOW_POLICIES, PulseEvent, PulsePipeline  # noqa: E402
+from src.running_stats import RunningStats  # noqa: E402
+from src.visa_discovery import VisaDiscovery  # noqa: E402
+from src.waveform_archive import ARCHIVE_SUFFIX, WaveformArchiveWriter  # noqa: E402
+from src.waveform_features import WaveformAverager, decode_waveform, extract_features  # noqa: E402
 from main.widgets.graph_widget import GraphWidget  # noqa: E402
 
 try:
@@ -30,20 +43,40 @@ try:
 except Exception:  # pragma: no cover - optional runtime dependency
     pyvisa = None
 
+# период опроса прибора и МПП, пока идет серия импульсов; не зависит от
+# длительности импульса, иначе короткие импульсы забивают очередь ввода-вывода
+PULSE_POLL_S = 0.05
+# каталог архивов осциллограмм серий импульсов
+WAVEFORM_ARCHIVE_DIR = Path().resolve() / "log" / "waveforms"
+
+
+def _is_keithley_2611(idn: str) -> bool:
+    return "KEITHLEY" in idn.upper() and "2611" in idn
+
 
 class Keithley2600Client:
-    def __init__(self, timeout_ms: int = 3000) -> None:
+    def __init__(self, timeout_ms: int = 3000, resource: str | None = None) -> None:
+        """resource - известный VISA-ресурс без авто-поиска, SIM::<модель> - симулятор."""
         self.timeout_ms = timeout_ms
         self.rm = None
         self.smu = None
-        self.resource = None
+        self.resource = resource
         self.idn = None
 
     def connect(self) -> str | None:
-        if keithley2600 is None:
-            raise RuntimeError("keithley2600 не установлен")
         if self.smu is not None:
             return self.idn
+        if self.resource is not None:
+            if keithley2600 is None and not is_sim_resource(self.resource):
+                raise RuntimeError("keithley2600 не установлен")
+            smu = open_keithley(self.resource)
+            if not smu.connected:
+                return None
+            self.smu = smu
+            self.idn = smu.connection.query("*IDN?").strip()
+            return self.idn
+        if keithley2600 is None:
+            raise RuntimeError("keithley2600 не установлен")
         self.idn = self._find_resource()
         if not self.idn:
             return None
@@ -51,39 +84,37 @@ class Keithley2600Client:
         return self.idn
 
     def _find_resource(self) -> str | None:
+        # последний найденный ресурс проверяется первым, остальные - параллельно (src/visa_discovery.py)
         if pyvisa is None:
             raise RuntimeError("pyvisa не установлен для авто-поиска")
-        self.rm = pyvisa.ResourceManager()
-        for res in self.rm.list_resources():
-            try:
-                inst = self.rm.open_resource(res)
-                inst.timeout = self.timeout_ms
-                idn = inst.query("*IDN?").strip()
-                inst.close()
-                if "KEITHLEY" in idn.upper() and "2611" in idn:
-                    self.resource = res
-                    return idn
-            except Exception:
-                continue
-        return None
+        if self.rm is None:
+            self.rm = pyvisa.ResourceManager()
+        found = VisaDiscovery(self.rm, _is_keithley_2611).find()
+        if found is None:
+            return None
+        self.resource, idn = found
+        return idn
 
     def _ensure_connected(self) -> None:
         if self.smu is None:
             raise RuntimeError("Keithley 2611B не подключен")
 
-    def prepare_source(self) -> None:
+    @property
+    def io(self) -> KeithleyIOWorker:
+        """Очередь команд прибора: присваивания подряд уходят одной TSP-строкой."""
         self._ensure_connected()
-        self.smu.smua.source.func = self.smu.smua.OUTPUT_DCVOLTS
-        self.smu.smua.source.output = self.smu.smua.OUTPUT_ON
+        return keithley_io(self.smu)
 
-    def set_level(self, level: float) -> None:
-        self._ensure_connected()
-        self.smu.smua.source.levelv = level
+    async def prepare_source(self) -> None:
+        await self.io.write("a", func="OUTPUT_DCVOLTS", output="OUTPUT_ON")
+
+    async def set_level(self, level: float) -> None:
+        await self.io.write("a", levelv=float(level))
 
-    def output_off(self) -> None:
+    async def output_off(self) -> None:
         if self.smu is None:
             return
-        self.smu.smua.source.output = self.smu.smua.OUTPUT_OFF
+        await self.io.write("a", output="OUTPUT_OFF")
 
 
 class KeithleyControl(QtWidgets.QWidget):
@@ -94,6 +125,11 @@ class KeithleyControl(QtWidgets.QWidget):
     checkBox_cont_mode: QtWidgets.QCheckBox
     pushButton_start: QtWidgets.QPushButton
     comboBox_mpp_ch: QtWidgets.QComboBox
+    comboBox_overflow: QtWidgets.QComboBox
+    label_queue: QtWidgets.QLabel
+    checkBox_average: QtWidgets.QCheckBox
+    spinBox_avg_n: QtWidgets.QSpinBox
+    label_features: QtWidgets.QLabel
 
     def __init__(self, *args) -> None:
         super().__init__(*args)
@@ -102,6 +138,9 @@ class KeithleyControl(QtWidgets.QWidget):
         self.parent = args[0]
         self.task_manager = AsyncTaskManager(self.logger)
         self.device = Keithley2600Client()
+        self._pulse_engine: TspPulseEngine | None = None
+        self._archive: WaveformArchiveWriter | None = None
+        self._averager: WaveformAverager | None = None
         self._running = False
         self.graph_widget: GraphWidget = self.parent.w_graph_widget  # type: ignore
         
@@ -176,31 +215,62 @@ class KeithleyControl(QtWidgets.QWidget):
         return True
 
     async def _apply_level(self, level: float) -> None:
-        await asyncio.to_thread(self.device.set_level, level)
+        await self.device.set_level(level)
 
     async def _output_off(self) -> None:
         if self.device.smu is None:
             return
         try:
-            await asyncio.to_thread(self.device.output_off)
+            await self.device.output_off()
             self.logger.info("Keithley 2611B: выход отключен")
+            self.logger.debug(f"Keithley 2611B I/O: {self.device.io.summary()}")
         except Exception as exc:
             self.logger.warning(f"Не удалось отключить выход Keithley 2611B: {exc}")
 
     async def _pulse_loop(self, u1: float, dur_s: float, period_s: float, count: int | None) -> None:
-        low_s = max(period_s - dur_s, 0.0)
-        done = 0
-        while self._running and (count is None or done < count):
-            await self._apply_level(u1)
-            if dur_s > 0:
-                await asyncio.sleep(dur_s)
-            await self._apply_level(0.0)
-            if low_s > 0:
-                await asyncio.sleep(low_s)
-            if dur_s == 0 and low_s == 0:
-                await asyncio.sleep(0)
-            done += 1
-            await self._mpp_read_sequence()
+        # импульсы формируют таймеры прибора; опрос импульсов, чтение осциллограмм МПП
+        # и отрисовка - отдельные стадии конвейера с ограниченными очередями
+        train = PulseTrain(u1, dur_s, period_s, count)
+        if self._pulse_engine is None or self._pulse_engine.k is not self.device.smu:
+            self._pulse_engine = TspPulseEngine(self.device.smu)
+        engine = self._pulse_engine
+        io = self.device.io
+        policy = OVERFLOW_POLICIES[max(self.comboBox_overflow.currentIndex(), 0)]
+        pipeline = PulsePipeline(
+            self._mpp_fetch_waveform,
+            self._mpp_draw_waveform,
+            policy=policy,
+            on_update=self._show_pipeline_stats,
+        )
+        archive_path = WAVEFORM_ARCHIVE_DIR / (datetime.now().strftime("%Y-%m-%d_%H-%M-%S") + ARCHIVE_SUFFIX)
+        self._archive = WaveformArchiveWriter(archive_path)
+        # режим усреднения: рисуется среднее по N захватам и параметры импульса
+        self._averager = WaveformAverager(self.spinBox_avg_n.value()) if self.checkBox_average.isChecked() else None
+        try:
+            if policy == "throttle":
+                events = self._pulse_events_throttled(engine, train)
+            else:
+                await io.call(engine.start, train)
+                events = self._pulse_events(engine, train)
+            await pipeline.run(events)
+        finally:
+            await io.call(engine.stop)
+            archive, self._archive = self._archive, None
+            self._averager = None
+            archive.close()
+            self.logger.info(f"Keithley 2611B: конвейер импульсов {pipeline.summary()}")
+            self.logger.info(f"МПП: {len(archive)} осциллограмм в {archive.path}")
+            if pipeline.fetched and len(archive) < pipeline.fetched:
+                # каждая прочитанная осциллограмма должна попасть в архив, в любом режиме
+                self.logger.warning(
+                    f"МПП: в архив записано {len(archive)} из {pipeline.fetched} прочитанных осциллограмм"
+                )
+        readings = RunningStats.of(await io.call(engine.readings))
+        if readings.count:
+            self.logger.info(
+                f"Keithley 2611B: {readings.count} импульсов, ток {readings.mean:.6g} А "
+                f"(min {readings.min:.6g}, max {readings.max:.6g})"
+            )
             
     async def _mpp_get_lvl(self) -> int:
         try:
@@ -211,7 +281,7 @@ class KeithleyControl(QtWidgets.QWidget):
                 if mpp_ch == 0
                 else await self.mpp_cmd.get_acq2_peak()
             )
-            zero_lvl: int = max(self.parser.mpp_pars_16b(output))
+            zero_lvl: int = max(pars_16b(output))
             return zero_lvl + 20
         except Exception as e:
             self.logger.error(e)
@@ -224,16 +294,81 @@ class KeithleyControl(QtWidgets.QWidget):
     async def _mpp_stop(self) -> None:
         await self.mpp_cmd.start_measure(on=0)
     
-    async def _mpp_read_sequence(self) -> None:
+    async def _pulse_events(self, engine: TspPulseEngine, train: PulseTrain) -> AsyncIterator[PulseEvent]:
+        """Событие на каждый опрос, за который прибор выдал новые импульсы."""
+        io = self.device.io
+        last = 0
+        while self._running:
+            done = await io.call(engine.progress)
+            if done > last:
+                last = done
+                yield PulseEvent(done)
+            if engine.finished(train, done):
+                return
+            await asyncio.sleep(PULSE_POLL_S)
+
+    async def _pulse_events_throttled(
+        self, engine: TspPulseEngine, train: PulseTrain
+    ) -> AsyncIterator[PulseEvent]:
+        """По одному импульсу по таймеру прибора; следующий - когда событие принято в очередь."""
+        io = self.device.io
+        single = PulseTrain(train.level_v, train.width_s, train.period_s, 1, train.limit_i, train.nplc)
+        done = 0
+        while self._running and (train.count is None or done < train.count):
+            started = asyncio.get_running_loop().time()
+            await io.call(engine.start, single)
+            while not engine.finished(single, await io.call(engine.progress)):
+                await asyncio.sleep(PULSE_POLL_S)
+            done += 1
+            yield PulseEvent(done)
+            rest = train.period_s - (asyncio.get_running_loop().time() - started)
+            if rest > 0:
+                await asyncio.sleep(rest)
+
+    def _show_pipeline_stats(self, stats: dict[str, int]) -> None:
+        self.label_queue.setText(
+            f"Очереди: чтение {stats['fetch_depth']}/{stats['fetch_max']}, "
+            f"отрисовка {stats['render_depth']}/{stats['render_max']}, пропущено {stats['dropped']}"
+        )
+
+    async def _mpp_fetch_waveform(self, event: PulseEvent) -> list[int] | np.ndarray:
         await self.mpp_cmd.issue_waveform()
         mpp_ch = 0 if self.comboBox_mpp_ch.currentIndex() == 0 else 1
         result_ch: bytes = await self.mpp_cmd.read_oscill(ch=mpp_ch)
-        result_ch_int: list[int] = await self.parser.mpp_pars_16b(result_ch)
-        await self.graph_widget.acq_pen.draw_graph(
-                        result_ch_int,
-                        save_log=False,
-                        clear=True,
-                    )  # x, y
+        averager = self._averager
+        # в режиме усреднения ответ один раз разбирается в numpy (отсчеты АЦП),
+        # тот же массив идет и в архив, и в среднее
+        data = decode_waveform(result_ch) if averager is not None else pars_16b(result_ch)
+        if self._archive is not None and len(data):
+            # время события импульса (monotonic) переводится во время Unix
+            self._archive.append(event.index, data, time.time() - (time.monotonic() - event.timestamp))
+        if averager is not None and len(data):
+            # в среднее попадает каждый захват, даже если его кадр не будет отрисован
+            averager.push(data)
+        return data
+
+    async def _mpp_draw_waveform(self, event: PulseEvent, data: list[int] | np.ndarray) -> None:
+        averager = self._averager
+        if averager is None:
+            await self.graph_widget.acq_pen.draw_graph(data, save_log=False, clear=True)
+            return
+        if not len(averager):
+            return
+        mean = averager.mean
+        trace = extract_features(mean)
+        captures = extract_features(averager.frames)
+        await self.graph_widget.acq_pen.draw_averaged(
+            mean, float(trace.baseline[0]), int(trace.position[0]), float(trace.amplitude[0])
+        )
+        self.label_features.setText(
+            f"Импульс: N={len(averager)}, база {trace.baseline[0]:.1f}, "
+            f"амплитуда {captures.amplitude.mean():.1f} ± {captures.amplitude.std():.1f}, "
+            f"пик {trace.position[0]}, площадь {trace.area[0]:.0f}"
+        )
+
+    async def _mpp_read_sequence(self) -> None:
+        event = PulseEvent(0)
+        await self._mpp_draw_waveform(event, await self._mpp_fetch_waveform(event))
 
     async def _run_sequence(self) -> None:
         try:
@@ -243,7 +378,7 @@ class KeithleyControl(QtWidgets.QWidget):
             count = int(self.spinBox_N.value())
             continuous = self.checkBox_cont_mode.isChecked()
 
-            await asyncio.to_thread(self.device.prepare_source)
+            await self.device.prepare_source()
             
             lvl = await self._mpp_get_lvl()
             await self._mpp_start(lvl)
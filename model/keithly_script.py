@@ -1,28 +1,46 @@
+import argparse
 import asyncio
-import csv
+import contextlib
 import json
+import math
+import random
 import re
 import sys
+import time
+from collections import deque
+from dataclasses import dataclass, field
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, Iterator, Literal
+from typing import TYPE_CHECKING, Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, Literal, TypeVar
 
 from loguru import logger
 from pydantic import BaseModel, model_validator
 from pymodbus.client import AsyncModbusSerialClient
 
-
-import matplotlib.pyplot as plt
-
-from keithley2600 import Keithley2600
+if TYPE_CHECKING:
+    from keithley2600 import Keithley2600
 
 
 src_path = Path(__file__).resolve().parent.parent
 sys.path.append(str(src_path))
 
+from src.adaptive_sweep import AdaptiveSweep
 from src.async_task_manager import AsyncTaskManager
+from src.calibration_fit import ChannelFits
+from src.checkpoint import CONFIG_SNAPSHOT, ProcessCheckpoint
 from src.cmd_interface import MPP_Commands
+from src.columnar_writer import ColumnarResultWriter
+from src.keithley_io import KeithleyIOWorker, keithley_io
+from src.keithley_sim import is_sim_resource, open_keithley
+from src.keithley_tsp import TspSweepEngine
 from src.log_config import log_init
+from src.plot_buffer import DecimatingRingBuffer
+from src.result_writer import BufferedResultWriter, ResultColumn
+from src.running_stats import RunningStats
+from src.setpoint_plan import PlanOrder, PlanProgress, SetpointPlan, linear_plan, load_plan, log_plan
+from src.stage_timer import PointTimer, StageHistograms
+
+T = TypeVar("T")
 
 
 class ConvinceMode(BaseModel):
@@ -41,11 +59,77 @@ class ConstMode(BaseModel):
     vg_cnst: float
 
 
+class LogMode(BaseModel):
+    vg_start: float
+    vg_stop: float
+    points: int
+    step_delay_s: float
+
+
+class FileMode(BaseModel):
+    # .npy или CSV: колонка напряжений и необязательная колонка пауз, с;
+    # относительный путь считается от файла конфигурации
+    path: str
+    step_delay_s: float = 0.0
+
+
+class PlanSettings(BaseModel):
+    # порядок обхода уставок и число повторов плана за цикл
+    order: PlanOrder = "forward"
+    repeats: int = 1
+    # None - новое зерно на запуск, сохраняется в контрольной точке
+    seed: int | None = None
+
+
+class AdaptiveMode(BaseModel):
+    vg_start: float
+    vg_stop: float
+    initial_points: int = 5
+    max_points: int = 50
+    # допустимый изгиб между соседними точками, доля размаха значений
+    tolerance: float = 0.01
+    # максимальный скачок значения на интервале, доля размаха значений
+    max_jump: float = 0.1
+    min_step_v: float = 0.0
+    step_delay_s: float
+
+
+class SettleSettings(BaseModel):
+    # точка считается установившейся, когда window подряд идущих отсчетов
+    # укладываются в tolerance + rel_tolerance * |среднее|
+    tolerance: float
+    rel_tolerance: float = 0.0
+    window: int = 3
+    sample_interval_s: float = 0.01
+    max_wait_s: float = 1.0
+
+
+class SamplingSettings(BaseModel):
+    samples_per_point: int = 1
+    # досрочная остановка, когда стандартная ошибка среднего <= target_sem
+    target_sem: float | None = None
+    min_samples: int = 2
+    sample_interval_s: float = 0.0
+
+
 class MeasureSettings(BaseModel):
     convince_mode: ConvinceMode | None = None
     linspace_mode: LinspaceMode | None = None
     const_mode: ConstMode | None = None
-    acq_channel: Literal[1, 2] = 1
+    log_mode: LogMode | None = None
+    file_mode: FileMode | None = None
+    adaptive_mode: AdaptiveMode | None = None
+    plan: PlanSettings = PlanSettings()
+    # при заданном settle фиксированная step_delay_s не используется
+    settle: SettleSettings | None = None
+    sampling: SamplingSettings | None = None
+    # calibrate_mode: выставлять уровень следующей точки параллельно чтению пика текущей.
+    # Безопасно, только если МПП фиксирует пик за время step_delay_s
+    pipeline: bool = False
+    # "both" - пики обоих каналов одним чтением ACQ1_PEAK..ACQ2_PEAK
+    acq_channel: Literal[1, 2, "both"] = 1
+    # "tsp" - развертка исполняется прибором целиком, "host" - по точке
+    sweep_engine: Literal["host", "tsp"] = "host"
 
     @model_validator(mode="after")
     def validate_single_mode(self) -> "MeasureSettings":
@@ -53,90 +137,368 @@ class MeasureSettings(BaseModel):
             self.convince_mode is not None,
             self.linspace_mode is not None,
             self.const_mode is not None,
+            self.log_mode is not None,
+            self.file_mode is not None,
+            self.adaptive_mode is not None,
         ]
         if sum(enabled_modes) != 1:
             raise ValueError("Exactly one measure mode must be set")
+        if self.adaptive_mode is not None and self.plan != PlanSettings():
+            raise ValueError("plan settings are not supported in adaptive_mode")
         return self
 
 
 class ModBusSettings(BaseModel):
-    id: int
+    id: int | None = None
+    # несколько МПП на одной шине: уровень выставляется один раз, опрашиваются все
+    ids: list[int] | None = None
     bodrate: int
     com: str
     timeout_s: float = 1.0
 
+    @model_validator(mode="after")
+    def validate_ids(self) -> "ModBusSettings":
+        if (self.id is None) == (not self.ids):
+            raise ValueError("Exactly one of id or ids must be set")
+        if self.ids and len(set(self.ids)) != len(self.ids):
+            raise ValueError(f"Duplicate MPP ids: {self.ids}")
+        return self
+
+    @property
+    def mpp_ids(self) -> list[int]:
+        return list(self.ids) if self.ids else [int(self.id)]  # type: ignore[arg-type]
+
+
+class WriterSettings(BaseModel):
+    batch_rows: int = 64
+    flush_interval_s: float = 1.0
+    rotate_rows: int | None = None
+    # дополнительный колоночный вывод рядом с CSV
+    columnar: Literal["npy", "parquet"] | None = None
+    columnar_group_rows: int = 1024
+
+
+class PlotSettings(BaseModel):
+    # точек без прореживания; более старые сворачиваются в пары min/max
+    capacity: int = 2048
+    bucket: int = 32
+    history_points: int = 2048
+    max_fps: float = 5.0
+
+
+class FitSettings(BaseModel):
+    # аппроксимация value(voltage) по мере поступления точек, только в calibrate_mode
+    enabled: bool = True
+    degree: int = 1
+    # вес точки 1/sem^2, если на точку снято несколько отсчетов
+    weighted: bool = False
+
 
 class MPModel(BaseModel):
     name: str
     calibrate_mode: bool
     modbus_settings: ModBusSettings | None = None
     measure_settings: MeasureSettings
+    smu_channel: Literal["a", "b"] = "a"
     current_limit: float
     loop: bool
     save_table: bool
     save_plot: bool
+    writer: WriterSettings = WriterSettings()
+    plot: PlotSettings = PlotSettings()
+    fit: FitSettings = FitSettings()
 
     @classmethod
     def pydentic_model_init(cls, data: dict) -> Dict[str, "MPModel"]:
         return {name: cls.model_validate(conf) for name, conf in data.items()}
 
 
+# acq_channel в таблице результатов для режима "both" (биты каналов 1 | 2)
+ACQ_BOTH_CODE = 3
+
+RESULT_COLUMNS: list[ResultColumn] = [
+    ResultColumn("timestamp", "datetime64[s]", "%Y-%m-%dT%H:%M:%S"),
+    ResultColumn("process_key", "str"),
+    ResultColumn("process_name", "str"),
+    ResultColumn("cycle", "int64"),
+    ResultColumn("step", "int64"),
+    ResultColumn("voltage_v", "float64", ".6f"),
+    ResultColumn("value", "float64", ".12g"),
+    ResultColumn("value_std", "float64", ".6g"),
+    ResultColumn("value_sem", "float64", ".6g"),
+    ResultColumn("value_min", "float64", ".12g"),
+    ResultColumn("value_max", "float64", ".12g"),
+    ResultColumn("samples", "int32"),
+    # пик канала 2 при acq_channel="both", иначе NaN
+    ResultColumn("value_ch2", "float64", ".12g"),
+    ResultColumn("value_ch2_std", "float64", ".6g"),
+    ResultColumn("mode", "str"),
+    ResultColumn("acq_channel", "int8"),
+    # адрес МПП, 0 - точка без МПП (адрес 0 в Modbus - широковещательный)
+    ResultColumn("mpp_id", "int32"),
+    ResultColumn("settle_s", "float64", ".6f"),
+    # монотонное время начала точки (perf_counter_ns) и длительности стадий, мкс
+    ResultColumn("t_mono_ns", "int64"),
+    ResultColumn("set_level_us", "float64", ".1f"),
+    ResultColumn("settle_us", "float64", ".1f"),
+    ResultColumn("modbus_cmd_us", "float64", ".1f"),
+    ResultColumn("read_us", "float64", ".1f"),
+    ResultColumn("plot_us", "float64", ".1f"),
+    # запись строки измеряется после нее, поэтому в строке - время записи предыдущей
+    ResultColumn("persist_prev_us", "float64", ".1f"),
+]
+
+
+@dataclass
+class MeasurePoint:
+    voltage: float
+    stats: RunningStats
+    mode: str
+    settle_s: float = 0.0
+    timer: PointTimer = field(default_factory=PointTimer)
+    stats_ch2: RunningStats | None = None
+    mpp_id: int = 0
+    # последняя строка уставки: при опросе нескольких МПП на уставку приходится по строке на МПП
+    last_of_setpoint: bool = True
+
+    @property
+    def value(self) -> float:
+        return self.stats.mean
+
+
+class CalibrationSession:
+    """Сессия калибровки на время всего процесса.
+
+    Держит один Modbus-клиент и один MPP_Commands (без пересоздания
+    ModbusWorker и его обработчиков логов на каждую точку) и копит
+    статистику задержки на точку.
+
+    При acq_channel="both" read_peak() возвращает пик канала 1, а пик
+    канала 2 из того же чтения копится в ch2_stats текущей точки.
+    """
+
+    def __init__(self, client: AsyncModbusSerialClient, mpp_id: int, acq_channel: int | str) -> None:
+        self.client = client
+        self.mpp_id = int(mpp_id)
+        self.mpp_cmd = MPP_Commands(client, logger, mpp_id)
+        self.dual = acq_channel == "both"
+        self.acq_channel = 1 if self.dual else int(acq_channel)
+        self.channel_index = self.acq_channel - 1
+        self.ch2_stats = RunningStats()
+        self._ch2_last = math.nan
+        self.latencies_s: deque[float] = deque(maxlen=4096)
+        self.points = 0
+        self.total_s = 0.0
+        self.max_s = 0.0
+
+    async def arm(self) -> None:
+        # сброс пикового детектора одного канала другой канал не затрагивает
+        # (документированного сброса обоих нет), поэтому в режиме "both"
+        # измерение запускается по каждому каналу
+        for channel_index in (0, 1) if self.dual else (self.channel_index,):
+            await self.mpp_cmd.start_measure_forced(channel_index)
+
+    async def read_peak(self) -> float:
+        if self.dual:
+            regs = MeasureProcessing._extract_u16_values(await self.mpp_cmd.get_acq_peaks())
+            if len(regs) < 2:
+                raise RuntimeError(f"Unexpected ACQ peaks payload: {regs}")
+            ch1, ch2 = regs[-2:]
+            self._ch2_last = float(ch2)
+            self.ch2_stats.push(ch2)
+            return float(ch1)
+        raw = (
+            await self.mpp_cmd.get_acq1_peak()
+            if self.acq_channel == 1
+            else await self.mpp_cmd.get_acq2_peak()
+        )
+        return float(MeasureProcessing._extract_u16_value(raw))
+
+    async def sample(self) -> float:
+        # пик читается по уже запущенному измерению, затем измерение перезапускается
+        value = await self.read_peak()
+        await self.arm()
+        return value
+
+    def restart_ch2(self, keep_last: bool = False) -> None:
+        """Начать статистику канала 2 новой точки.
+
+        keep_last - с последнего отсчета установления, он же первый отсчет точки.
+        """
+        self.ch2_stats = RunningStats()
+        if keep_last and not math.isnan(self._ch2_last):
+            self.ch2_stats.push(self._ch2_last)
+
+    def take_ch2(self) -> RunningStats | None:
+        return self.ch2_stats if self.dual else None
+
+    def record_latency(self, seconds: float) -> None:
+        self.latencies_s.append(seconds)
+        self.points += 1
+        self.total_s += seconds
+        self.max_s = max(self.max_s, seconds)
+
+    def latency_summary(self) -> str:
+        if not self.points:
+            return "no points"
+        recent = sorted(self.latencies_s)
+        p50 = recent[len(recent) // 2]
+        p95 = recent[min(len(recent) - 1, int(len(recent) * 0.95))]
+        mean = self.total_s / self.points
+        return (
+            f"{self.points} points, mean {mean * 1e3:.1f} ms, p50 {p50 * 1e3:.1f} ms, "
+            f"p95 {p95 * 1e3:.1f} ms, max {self.max_s * 1e3:.1f} ms, {1 / mean:.2f} points/s"
+        )
+
+
+class FanoutSession:
+    """Калибровка нескольких МПП на одной шине RS-485.
+
+    Держит по CalibrationSession на каждый адрес с общим Modbus-клиентом.
+    Modbus RTU на одной линии полудуплексный - транзакции к разным МПП
+    идут по очереди. Выигрыш в том, что уровень Keithley выставляется и
+    устанавливается один раз для всех МПП.
+    """
+
+    def __init__(self, client: AsyncModbusSerialClient, mpp_ids: list[int], acq_channel: int | str) -> None:
+        self.sessions = [CalibrationSession(client, mpp_id, acq_channel) for mpp_id in mpp_ids]
+
+    @property
+    def primary(self) -> CalibrationSession:
+        return self.sessions[0]
+
+    async def each(self, action: Callable[[CalibrationSession], Awaitable[T]]) -> list[T]:
+        return [await action(session) for session in self.sessions]
+
+    async def arm(self) -> None:
+        await self.each(lambda session: session.arm())
+
+    def record_latency(self, seconds: float) -> None:
+        for session in self.sessions:
+            session.record_latency(seconds)
+
+    def latency_summary(self) -> str:
+        return f"{len(self.sessions)} MPP, per setpoint {self.primary.latency_summary()}"
+
+
 class MatplotlibRealtimePlot:
-    def __init__(self, title: str) -> None:
-        plt.ion()
+    """Живой график процесса.
+
+    update() только кладет точку в буфер ограниченного размера; перерисовка
+    идет в отдельной задаче не чаще max_fps раз в секунду. Без окна
+    (interactive=False) график только копится и рисуется один раз в save_png.
+    """
+
+    def __init__(self, title: str, settings: PlotSettings | None = None, interactive: bool = True) -> None:
+        settings = settings or PlotSettings()
+        # matplotlib грузится только когда график действительно нужен
+        import matplotlib
+
+        if not interactive:
+            matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+
+        self._plt = plt
+        if interactive:
+            plt.ion()
         self.fig, self.ax = plt.subplots(num=title)
-        self.line, = self.ax.plot([], [], marker="o")
+        self.line, = self.ax.plot([], [], marker="o", markersize=3)
         self.ax.set_title(title)
         self.ax.set_xlabel("Voltage, V")
         self.ax.set_ylabel("Measured value")
         self.ax.grid(True, alpha=0.3)
-        self._x: list[float] = []
-        self._y: list[float] = []
-        self.fig.show()
-        self.fig.canvas.draw_idle()
+        self._buffer = DecimatingRingBuffer(
+            capacity=settings.capacity,
+            bucket=settings.bucket,
+            history_points=settings.history_points,
+        )
+        self._min_interval_s = 1.0 / settings.max_fps if settings.max_fps > 0 else 0.0
+        self._dirty = asyncio.Event()
+        self._render_task: asyncio.Task | None = None
+        self._interactive = interactive
+        if interactive:
+            self.fig.show()
+            self.fig.canvas.draw_idle()
 
     async def update(self, voltage: float, value: float) -> None:
-        self._x.append(float(voltage))
-        self._y.append(float(value))
-        self.line.set_data(self._x, self._y)
+        self._buffer.append(float(voltage), float(value))
+        if not self._interactive:
+            return
+        self._dirty.set()
+        if self._render_task is None:
+            self._render_task = asyncio.create_task(self._render_loop())
+        await asyncio.sleep(0)
+
+    async def _render_loop(self) -> None:
+        while True:
+            await self._dirty.wait()
+            self._dirty.clear()
+            self._redraw()
+            await asyncio.sleep(self._min_interval_s)
+
+    def _redraw(self) -> None:
+        x, y = self._buffer.arrays()
+        self.line.set_data(x, y)
         self.ax.relim()
         self.ax.autoscale_view()
-        self.fig.canvas.draw_idle()
-        self.fig.canvas.flush_events()
-        await asyncio.sleep(0)
+        if self._interactive:
+            self.fig.canvas.draw_idle()
+            self.fig.canvas.flush_events()
 
     def save_png(self, file_path: Path) -> None:
+        self._redraw()
         self.fig.savefig(file_path, dpi=150, bbox_inches="tight")
 
     def close(self) -> None:
-        if plt is not None:
-            plt.close(self.fig)
+        if self._render_task is not None:
+            self._render_task.cancel()
+            self._render_task = None
+        self._plt.close(self.fig)
 
 
 class MeasureProcessing:
     def __init__(
         self,
-        k: Keithley2600 | None = None,
+        k: "Keithley2600 | None" = None,
         mb_client: AsyncModbusSerialClient | None = None,
+        output_root: str | Path = "measure",
+        live_plot: bool = True,
     ) -> None:
         self.k = k
-        self.mb_client = mb_client
         self.mp_model: Dict[str, MPModel] = {}
         self.task_manager = AsyncTaskManager(logger)
-        self._active_modbus_fp: tuple[str, int, float] | None = None
-        self.output_dir: Path = Path("measure")
-
-    def load_config(self, json_conf: str | Path) -> None:
+        # клиенты Modbus по COM-порту: процессы на разных портах идут параллельно
+        self.mb_clients: Dict[str, AsyncModbusSerialClient] = {}
+        self._active_modbus_fp: Dict[str, tuple[str, int, float]] = {}
+        if mb_client is not None:
+            self.mb_clients[str(mb_client.comm_params.host)] = mb_client
+        self.output_root = Path(output_root)
+        self.output_dir: Path = self.output_root
+        # без живого окна график строится только для save_plot
+        self.live_plot = live_plot
+        self._tsp_engines: Dict[str, TspSweepEngine] = {}
+        # последний выставленный хостом уровень по SMU
+        self._levels: Dict[str, float] = {}
+        self._resource_locks: Dict[tuple, asyncio.Lock] = {}
+
+    def load_config(self, json_conf: str | Path) -> bool:
         try:
             with open(json_conf, "r", encoding="utf-8") as jsn:
                 raw = json.load(jsn)
         except Exception:
             logger.error("Measure config not found")
-            return
+            return False
         try:
             self.mp_model = MPModel.pydentic_model_init(raw)
         except Exception as exc:
             logger.error(exc)
+            return False
+        base_dir = Path(json_conf).resolve().parent
+        for process in self.mp_model.values():
+            file_mode = process.measure_settings.file_mode
+            if file_mode is not None and not Path(file_mode.path).is_absolute():
+                file_mode.path = str(base_dir / file_mode.path)
+        return True
 
     async def run_process(self) -> None:
         if not self.mp_model:
@@ -145,199 +507,805 @@ class MeasureProcessing:
             raise RuntimeError("Keithley is not connected")
 
         ts = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        self.output_dir = Path("measure") / ts
+        self.output_dir = self.output_root / ts
         self.output_dir.mkdir(parents=True, exist_ok=True)
         logger.info(f"Measure output dir: {self.output_dir}")
+        snapshot = {key: process.model_dump(mode="json") for key, process in self.mp_model.items()}
+        (self.output_dir / CONFIG_SNAPSHOT).write_text(
+            json.dumps(snapshot, ensure_ascii=False, indent=4), encoding="utf-8"
+        )
+        await self._run_all(resume=False)
 
+    async def resume(self, run_dir: str | Path) -> None:
+        """Продолжить прерванный запуск в том же каталоге с последней сохраненной точки."""
+        if self.k is None:
+            raise RuntimeError("Keithley is not connected")
+        self.output_dir = Path(run_dir)
+        self.load_config(self.output_dir / CONFIG_SNAPSHOT)
+        if not self.mp_model:
+            raise RuntimeError(f"No config snapshot in {self.output_dir}")
+        logger.info(f"Resuming measure in: {self.output_dir}")
+        await self._run_all(resume=True)
+
+    async def _run_all(self, resume: bool) -> None:
+        used_smu = sorted({process.smu_channel for process in self.mp_model.values()})
         try:
+            tasks: list[asyncio.Task] = []
             for proc_key, process in self.mp_model.items():
                 task_name = f"measure_{proc_key}"
-                self.task_manager.create_task(self._run_single_process(proc_key, process), task_name)
+                checkpoint = self._load_checkpoint(process) if resume else None
+                if checkpoint is not None and checkpoint.done:
+                    logger.info(f"Process already finished, skipped: {proc_key} ({process.name})")
+                    continue
+                self.task_manager.create_task(self._run_scheduled(proc_key, process, checkpoint), task_name)
                 task = self.task_manager.tasks.get(task_name)
                 if task is not None:
-                    await task
+                    tasks.append(task)
+            await self._wait_processes(tasks)
         finally:
-            await self._safe_keithley_output_off()
+            for smu in used_smu:
+                await self._safe_keithley_output_off(smu)
             await self._close_modbus()
+            if self.k is not None:
+                logger.info(f"Keithley I/O: {self._keithley_io().summary()}")
+
+    async def _wait_processes(self, tasks: list[asyncio.Task]) -> None:
+        if not tasks:
+            return
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        failed = next((t for t in done if not t.cancelled() and t.exception() is not None), None)
+        if failed is None:
+            return
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        raise failed.exception()  # type: ignore[misc]
 
-    async def _run_single_process(self, proc_key: str, process: MPModel) -> None:
-        await self._prepare_keithley_source(current_limit=process.current_limit)
-        plotter = MatplotlibRealtimePlot(title=f"{proc_key}: {process.name}")
+    @staticmethod
+    def _process_resources(process: MPModel) -> list[tuple]:
+        resources: list[tuple] = [("smu", process.smu_channel)]
+        if process.calibrate_mode and process.modbus_settings is not None:
+            resources.append(("com", process.modbus_settings.com))
+            for mpp_id in process.modbus_settings.mpp_ids:
+                resources.append(("mpp", process.modbus_settings.com, mpp_id))
+        return sorted(resources)
+
+    async def _run_scheduled(
+        self, proc_key: str, process: MPModel, checkpoint: ProcessCheckpoint | None = None
+    ) -> None:
+        # блокировки берутся в отсортированном порядке, поэтому процессы с общим
+        # ресурсом выполняются по очереди, а независимые - одновременно
+        resources = self._process_resources(process)
+        async with contextlib.AsyncExitStack() as stack:
+            for resource in resources:
+                lock = self._resource_locks.setdefault(resource, asyncio.Lock())
+                await stack.enter_async_context(lock)
+            logger.debug(f"Process {proc_key} acquired resources: {resources}")
+            await self._run_single_process(proc_key, process, checkpoint)
+
+    def _load_checkpoint(self, process: MPModel) -> ProcessCheckpoint | None:
+        csv_path = self.output_dir / f"{self._sanitize_filename(process.name)}.csv"
+        return ProcessCheckpoint.load(ProcessCheckpoint.path_for(csv_path))
+
+    async def _run_single_process(
+        self, proc_key: str, process: MPModel, checkpoint: ProcessCheckpoint | None = None
+    ) -> None:
+        smu = process.smu_channel
+        await self._prepare_keithley_source(current_limit=process.current_limit, smu=smu)
+        plotter: MatplotlibRealtimePlot | None = None
+        if self.live_plot or process.save_plot:
+            plotter = MatplotlibRealtimePlot(
+                title=f"{proc_key}: {process.name}", settings=process.plot, interactive=self.live_plot
+            )
         safe_name = self._sanitize_filename(process.name)
         csv_path = self.output_dir / f"{safe_name}.csv"
         png_path = self.output_dir / f"{safe_name}.png"
 
-        fieldnames = [
-            "timestamp",
-            "process_key",
-            "process_name",
-            "cycle",
-            "step",
-            "voltage_v",
-            "value",
-            "mode",
-            "acq_channel",
-        ]
-
-        logger.info(f"Process started: {proc_key} ({process.name})")
-        step_idx = 0
-        cycle = 0
-
+        # все, что создано до отказа, закрывается в finally; отказ открытия Modbus
+        # не оставляет выход Keithley включенным
+        writers: list[BufferedResultWriter | ColumnarResultWriter] = []
+        session: CalibrationSession | FanoutSession | None = None
+        fits: Dict[int, ChannelFits] = {}
+        histograms = StageHistograms()
         try:
-            with csv_path.open("w", newline="", encoding="utf-8") as csv_file:
-                writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
-                writer.writeheader()
-                while True:
-                    for voltage, delay_s in self._iter_setpoints(process.measure_settings):
-                        if process.calibrate_mode:
-                            value = await self._measure_calibration_point(
-                                process=process,
-                                voltage=voltage,
-                                delay_s=delay_s,
+            writers = self._make_writers(csv_path, process.writer)
+            acq_channel = process.measure_settings.acq_channel
+            acq_code = ACQ_BOTH_CODE if acq_channel == "both" else acq_channel
+            session = await self._open_calibration_session(process) if process.calibrate_mode else None
+            checkpoint_path = ProcessCheckpoint.path_for(csv_path)
+            resumed = checkpoint is not None
+            if checkpoint is None:
+                checkpoint = ProcessCheckpoint(process_key=proc_key)
+
+            if resumed:
+                logger.info(
+                    f"Process resumed: {proc_key} ({process.name}) "
+                    f"cycle {checkpoint.cycle}, point {checkpoint.index}, step {checkpoint.step}"
+                )
+            else:
+                logger.info(f"Process started: {proc_key} ({process.name})")
+            step_idx = checkpoint.step
+            cycle = checkpoint.cycle
+            persist_prev_us = 0.0
+            mpp_ids = process.modbus_settings.mpp_ids if session is not None and process.modbus_settings else [0]
+            # аппроксимации по МПП; при нескольких МПП на живом графике - первый из списка
+            if process.calibrate_mode and process.fit.enabled:
+                fits = {mpp_id: ChannelFits(process.fit.degree) for mpp_id in mpp_ids}
+                if len(mpp_ids) == 1:
+                    fits[mpp_ids[0]].restore(checkpoint.fit)
+                else:
+                    for mpp_id, mpp_fits in fits.items():
+                        mpp_fits.restore((checkpoint.mpp_fits or {}).get(str(mpp_id)))
+            start_index = checkpoint.index
+            planner_state = checkpoint.planner
+            finished = False
+            base_plan = self._compile_plan(process.measure_settings)
+            plan_settings = process.measure_settings.plan
+            if plan_settings.order == "random" and plan_settings.seed is None and checkpoint.plan_seed is None:
+                checkpoint.plan_seed = random.getrandbits(32)
+            plan_seed = plan_settings.seed if plan_settings.seed is not None else checkpoint.plan_seed
+
+            def _save_checkpoint(index: int, planner: AdaptiveSweep | None, done: bool = False) -> None:
+                checkpoint.cycle = cycle
+                checkpoint.step = step_idx
+                checkpoint.index = index
+                checkpoint.done = done
+                checkpoint.planner = planner.state() if planner is not None else None
+                checkpoint.writers = [writer.state() for writer in writers]
+                if len(fits) > 1:
+                    checkpoint.mpp_fits = {str(mpp_id): mpp_fits.state() for mpp_id, mpp_fits in fits.items()}
+                else:
+                    checkpoint.fit = next((mpp_fits.state() for mpp_fits in fits.values()), None)
+                checkpoint.save(checkpoint_path)
+
+            with contextlib.ExitStack() as stack:
+                for position, writer in enumerate(writers):
+                    saved = checkpoint.writers[position] if position < len(checkpoint.writers) else None
+                    writer.open(append=resumed, state=saved if resumed else None)
+                    stack.callback(writer.close)
+                csv_writer = writers[0]
+                planner: AdaptiveSweep | None = None
+                index = start_index
+                checkpoint_due = False
+                setpoint_rows: list[tuple] = []
+                setpoint_fits: list[tuple[ChannelFits, int, float, float, float]] = []
+                try:
+                    while True:
+                        planner = self._make_adaptive_planner(process.measure_settings)
+                        if planner is not None and planner_state is not None:
+                            planner.restore(planner_state)
+                        planner_state = None
+                        index = start_index
+                        plan: SetpointPlan | None = None
+                        progress: PlanProgress | None = None
+                        if base_plan is not None:
+                            # случайный порядок - свой на каждый цикл, но воспроизводимый при продолжении
+                            seed = plan_seed + cycle if plan_seed is not None else None
+                            plan = base_plan.ordered(plan_settings.order, plan_settings.repeats, seed)
+                            progress = PlanProgress(len(plan), start_index)
+                            logger.info(
+                                f"Plan {proc_key} cycle {cycle}: {len(plan)} points, "
+                                f"step delays {plan.duration_s():.1f} s"
+                            )
+                        async for point in self._measure_cycle(process, session, planner, start_index, plan):
+                            timer = point.timer
+                            if plotter is not None and point.mpp_id == mpp_ids[0]:
+                                with timer.stage("plot"):
+                                    await plotter.update(point.voltage, point.value)
+                            committed = csv_writer.rows_total
+                            ch2 = point.stats_ch2
+                            row = (
+                                datetime.now(),
+                                proc_key,
+                                process.name,
+                                cycle,
+                                step_idx,
+                                point.voltage,
+                                point.value,
+                                point.stats.std,
+                                point.stats.sem if point.stats.count > 1 else math.nan,
+                                point.stats.min,
+                                point.stats.max,
+                                point.stats.count,
+                                ch2.mean if ch2 is not None and ch2.count else math.nan,
+                                ch2.std if ch2 is not None and ch2.count else math.nan,
+                                point.mode,
+                                acq_code,
+                                point.mpp_id,
+                                point.settle_s,
+                                timer.started_ns,
+                                timer.micros("set_level"),
+                                timer.micros("settle"),
+                                timer.micros("modbus_cmd"),
+                                timer.micros("read"),
+                                timer.micros("plot"),
+                                persist_prev_us,
                             )
-                            mode = "modbus_peak"
-                        else:
-                            value = await self._measure_keithley_current_point(voltage, delay_s)
-                            mode = "keithley_current_a"
-
-                        row = {
-                            "timestamp": datetime.now().isoformat(timespec="seconds"),
-                            "process_key": proc_key,
-                            "process_name": process.name,
-                            "cycle": cycle,
-                            "step": step_idx,
-                            "voltage_v": f"{voltage:.6f}",
-                            "value": f"{value:.12g}",
-                            "mode": mode,
-                            "acq_channel": process.measure_settings.acq_channel,
-                        }
-                        writer.writerow(row)
-                        csv_file.flush()
-                        await plotter.update(voltage, value)
-                        step_idx += 1
-
-                    cycle += 1
-                    if not process.loop:
-                        break
+                            step_idx += 1
+                            # при нескольких МПП строки и точки аппроксимации уставки копятся до
+                            # последнего МПП: прерванная посередине уставка не попадает ни в файлы,
+                            # ни в контрольную точку и при продолжении измеряется заново целиком
+                            setpoint_rows.append(row)
+                            point_fits = fits.get(point.mpp_id)
+                            if point_fits is not None:
+                                setpoint_fits.append(
+                                    (
+                                        point_fits,
+                                        1 if ch2 is not None else acq_channel,
+                                        point.voltage,
+                                        point.value,
+                                        self._fit_weight(point.stats, process.fit),
+                                    )
+                                )
+                                if ch2 is not None and ch2.count:
+                                    setpoint_fits.append(
+                                        (point_fits, 2, point.voltage, ch2.mean, self._fit_weight(ch2, process.fit))
+                                    )
+                            if point.last_of_setpoint:
+                                index += 1
+                                for point_fits, fit_channel, voltage, value, weight in setpoint_fits:
+                                    point_fits.push(fit_channel, voltage, value, weight)
+                                with timer.stage("persist"):
+                                    for setpoint_row in setpoint_rows:
+                                        for writer in writers:
+                                            writer.write(setpoint_row)
+                                    checkpoint_due = checkpoint_due or csv_writer.rows_total != committed
+                                    if checkpoint_due:
+                                        # пачка CSV на диске - догоняем остальные писатели и фиксируем позицию
+                                        for writer in writers:
+                                            writer.flush()
+                                        _save_checkpoint(index, planner)
+                                        checkpoint_due = False
+                                setpoint_rows.clear()
+                                setpoint_fits.clear()
+                            persist_prev_us = timer.micros("persist")
+                            histograms.add(timer)
+                            if progress is not None and point.last_of_setpoint:
+                                report = progress.report(index)
+                                if report is not None:
+                                    logger.info(f"Progress {proc_key} cycle {cycle}: {report}")
+
+                        start_index = 0
+                        index = 0
+                        planner = None
+                        cycle += 1
+                        if not process.loop:
+                            break
+                    finished = True
+                finally:
+                    for writer in writers:
+                        writer.flush()
+                    # шаги недомеренной уставки не сохраняются, при продолжении она повторяется
+                    step_idx -= len(setpoint_rows)
+                    _save_checkpoint(index, planner, done=finished)
         finally:
-            if process.save_plot:
+            if process.save_plot and plotter is not None:
                 plotter.save_png(png_path)
                 logger.info(f"Saved plot: {png_path}")
             if process.save_table:
-                logger.info(f"Saved table: {csv_path}")
-            plotter.close()
-            await self._safe_keithley_output_off()
+                saved = [str(path) for writer in writers for path in writer.paths]
+                logger.info(f"Saved table: {', '.join(saved)}")
+            for mpp_id, mpp_fits in fits.items():
+                if mpp_fits.fits:
+                    self._save_fit(mpp_fits, csv_path, proc_key, process, mpp_id if len(fits) > 1 else None)
+            if plotter is not None:
+                plotter.close()
+            if session is not None:
+                logger.info(f"Calibration point latency {proc_key}: {session.latency_summary()}")
+            for line in histograms.summary():
+                logger.info(f"Stage latency {proc_key} {line}")
+            await self._safe_keithley_output_off(smu)
             logger.info(f"Process finished: {proc_key} ({process.name})")
 
-    async def _measure_calibration_point(
-        self,
-        process: MPModel,
-        voltage: float,
-        delay_s: float,
-    ) -> float:
+    @staticmethod
+    def _fit_weight(stats: RunningStats, settings: FitSettings) -> float:
+        if not settings.weighted or stats.count < 2:
+            return 1.0
+        sem = stats.sem
+        return 1.0 / (sem * sem) if sem > 0 else 1.0
+
+    @staticmethod
+    def _save_fit(
+        fits: ChannelFits, csv_path: Path, proc_key: str, process: MPModel, fanout_id: int | None = None
+    ) -> None:
+        # при опросе нескольких МПП - отдельный файл коэффициентов на каждый МПП
+        if fanout_id is not None:
+            csv_path = csv_path.with_name(f"{csv_path.stem}_mpp{fanout_id}{csv_path.suffix}")
+        coeffs_path = ChannelFits.path_for(csv_path)
+        meta: dict[str, Any] = {"process_key": proc_key, "process_name": process.name}
+        if fanout_id is not None:
+            meta["mpp_id"] = fanout_id
+        elif process.modbus_settings is not None:
+            meta["mpp_id"] = process.modbus_settings.mpp_ids[0]
+        fits.save(coeffs_path, meta)
+        label = proc_key if fanout_id is None else f"{proc_key} mpp{fanout_id}"
+        for channel, fit in sorted(fits.fits.items()):
+            result = fit.result()
+            if "error" in result:
+                logger.warning(f"Calibration fit {label} ch{channel}: {result['error']} ({result['n']})")
+                continue
+            r2 = "n/a" if result["r2"] is None else f"{result['r2']:.6f}"
+            logger.info(
+                f"Calibration fit {label} ch{channel}: gain {result['gain']:.6g}, "
+                f"offset {result['offset']:.6g}, rms {result['residual_rms']:.4g}, r2 {r2}"
+            )
+        logger.info(f"Saved calibration coefficients: {coeffs_path}")
+
+    @staticmethod
+    def _make_writers(
+        csv_path: Path, settings: WriterSettings
+    ) -> list[BufferedResultWriter | ColumnarResultWriter]:
+        writers: list[BufferedResultWriter | ColumnarResultWriter] = [
+            BufferedResultWriter(
+                csv_path,
+                RESULT_COLUMNS,
+                batch_rows=settings.batch_rows,
+                flush_interval_s=settings.flush_interval_s,
+                rotate_rows=settings.rotate_rows,
+            )
+        ]
+        if settings.columnar is not None:
+            writers.append(
+                ColumnarResultWriter(
+                    csv_path,
+                    RESULT_COLUMNS,
+                    fmt=settings.columnar,
+                    group_rows=settings.columnar_group_rows,
+                    flush_interval_s=max(settings.flush_interval_s, 1.0),
+                )
+            )
+        return writers
+
+    async def _open_calibration_session(self, process: MPModel) -> CalibrationSession | FanoutSession:
         if process.modbus_settings is None:
             raise RuntimeError("modbus_settings is required in calibrate_mode")
-
-        connected = await self.connect_modbus(process.modbus_settings)
-        if not connected or self.mb_client is None:
+        mb_client = await self.connect_modbus(process.modbus_settings)
+        if mb_client is None:
             raise RuntimeError("Modbus client is not connected")
+        mpp_ids = process.modbus_settings.mpp_ids
+        acq_channel = process.measure_settings.acq_channel
+        if len(mpp_ids) > 1:
+            return FanoutSession(mb_client, mpp_ids, acq_channel)
+        return CalibrationSession(mb_client, mpp_ids[0], acq_channel)
 
-        mpp_cmd = MPP_Commands(self.mb_client, logger, process.modbus_settings.id)
-        channel_index = int(process.measure_settings.acq_channel - 1)
+    async def _measure_cycle(
+        self,
+        process: MPModel,
+        session: CalibrationSession | FanoutSession | None = None,
+        planner: AdaptiveSweep | None = None,
+        start_index: int = 0,
+        plan: SetpointPlan | None = None,
+    ) -> AsyncIterator[MeasurePoint]:
+        # start_index - число точек цикла, уже снятых до возобновления;
+        # адаптивный планировщик сам пропускает точки из восстановленного состояния
+        if plan is None and planner is None:
+            plan = self._compile_plan(process.measure_settings)
+        if plan is not None and self._use_tsp_sweep(process, plan):
+            async for point in self._measure_cycle_tsp(process, plan, start_index):
+                yield point
+            return
 
-        await mpp_cmd.start_measure_forced(channel_index)
-        await self._keithley_set_voltage(voltage)
-        if delay_s > 0:
-            await asyncio.sleep(delay_s)
+        if planner is not None:
+            delay = float(process.measure_settings.adaptive_mode.step_delay_s)  # type: ignore[union-attr]
+            setpoints: Iterator[tuple[float, float]] = ((voltage, delay) for voltage in planner)
+        else:
+            setpoints = plan.iter_from(start_index)  # type: ignore[union-attr]
+
+        if isinstance(session, FanoutSession):
+            if process.measure_settings.pipeline:
+                logger.warning(f"Pipeline is not available for several MPP, points are sequential: {process.name}")
+            async for point in self._measure_cycle_fanout(process, session, planner, setpoints):
+                yield point
+            return
 
-        raw = (
-            await mpp_cmd.get_acq1_peak()
-            if process.measure_settings.acq_channel == 1
-            else await mpp_cmd.get_acq2_peak()
+        if session is not None and process.measure_settings.pipeline and planner is None:
+            async for point in self._measure_cycle_pipelined(process, session, setpoints):
+                yield point
+            return
+
+        for voltage, delay_s in setpoints:
+            if session is not None:
+                started = time.perf_counter()
+                point = await self._measure_calibration_point(
+                    process=process,
+                    session=session,
+                    voltage=voltage,
+                    delay_s=delay_s,
+                )
+                session.record_latency(time.perf_counter() - started)
+            else:
+                point = await self._measure_keithley_current_point(
+                    voltage,
+                    delay_s,
+                    process.smu_channel,
+                    process.measure_settings.settle,
+                    process.measure_settings.sampling,
+                )
+            if planner is not None:
+                planner.record(voltage, point.value)
+            yield point
+
+    async def _measure_cycle_fanout(
+        self,
+        process: MPModel,
+        fanout: FanoutSession,
+        planner: AdaptiveSweep | None,
+        setpoints: Iterator[tuple[float, float]],
+    ) -> AsyncIterator[MeasurePoint]:
+        for voltage, delay_s in setpoints:
+            started = time.perf_counter()
+            points = await self._measure_fanout_point(process, fanout, voltage, delay_s)
+            fanout.record_latency(time.perf_counter() - started)
+            if planner is not None:
+                # адаптивная сетка строится по первому МПП, остальные снимаются в тех же точках
+                planner.record(voltage, points[0].value)
+            points[-1].last_of_setpoint = True
+            for point in points:
+                yield point
+
+    @staticmethod
+    def _make_adaptive_planner(measure_settings: MeasureSettings) -> AdaptiveSweep | None:
+        adaptive = measure_settings.adaptive_mode
+        if adaptive is None:
+            return None
+        return AdaptiveSweep(
+            start=adaptive.vg_start,
+            stop=adaptive.vg_stop,
+            initial_points=adaptive.initial_points,
+            max_points=adaptive.max_points,
+            tolerance=adaptive.tolerance,
+            max_jump=adaptive.max_jump,
+            min_step=adaptive.min_step_v,
         )
-        return float(self._extract_u16_value(raw))
 
-    async def _measure_keithley_current_point(self, voltage: float, delay_s: float) -> float:
-        await self._keithley_set_voltage(voltage)
-        if delay_s > 0:
-            await asyncio.sleep(delay_s)
-        return await asyncio.to_thread(self._read_keithley_current_sync)
+    def _use_tsp_sweep(self, process: MPModel, plan: SetpointPlan) -> bool:
+        settings = process.measure_settings
+        if settings.sweep_engine != "tsp":
+            return False
+        if process.calibrate_mode:
+            # между точками нужен Modbus-опрос МПП, развертка остается на хосте
+            logger.warning(f"TSP sweep is not available in calibrate_mode, fallback to host loop: {process.name}")
+            return False
+        if settings.const_mode is not None:
+            return False
+        if plan.uniform_delay is None:
+            logger.warning(f"TSP sweep needs one step delay for all points, fallback to host loop: {process.name}")
+            return False
+        return True
+
+    async def _measure_cycle_tsp(
+        self, process: MPModel, plan: SetpointPlan, start_index: int = 0
+    ) -> AsyncIterator[MeasurePoint]:
+        if self.k is None:
+            raise RuntimeError("Keithley is not connected")
+        levels = plan.voltages[start_index:]
+        if not levels.size:
+            return
+        delay_s = float(plan.uniform_delay or 0.0)
+        smu = process.smu_channel
+        engine = self._tsp_engines.get(smu)
+        if engine is None or engine.k is not self.k:
+            engine = self._tsp_engines[smu] = TspSweepEngine(self.k, smu=f"smu{smu}")
+
+        sampling = process.measure_settings.sampling
+        count = max(1, sampling.samples_per_point) if sampling is not None else 1
+
+        sweep_timer = PointTimer()
+        with sweep_timer.stage("read"):
+            values = await self._keithley_io().call(engine.run, levels, delay_s, count)
+        self._levels[smu] = float(levels[-1])
+        logger.debug(f"TSP sweep finished: {len(values)} readings")
+        # прибор проходит развертку сам, время делится поровну между точками
+        per_point_ns = sweep_timer.stages["read"] // len(levels)
+        for index, voltage in enumerate(levels.tolist()):
+            stats = RunningStats.of(values[index * count : (index + 1) * count])
+            timer = PointTimer()
+            timer.stages["read"] = per_point_ns
+            yield MeasurePoint(voltage, stats, "keithley_current_a", delay_s, timer)
+
+    async def _measure_cycle_pipelined(
+        self,
+        process: MPModel,
+        session: CalibrationSession,
+        setpoints: Iterator[tuple[float, float]],
+    ) -> AsyncIterator[MeasurePoint]:
+        # уровень точки i+1 выставляется на Keithley (LAN) одновременно с чтением
+        # пика точки i по Modbus; измерение МПП запускается уже после смены уровня
+        smu = process.smu_channel
+        settle = process.measure_settings.settle
+        sampling = process.measure_settings.sampling
+        multi = sampling is not None and sampling.samples_per_point > 1
+        current = next(setpoints, None)
+        if current is None:
+            return
+        timer = PointTimer()
+        with timer.stage("set_level"):
+            await self._keithley_set_voltage(current[0], smu)
+        while current is not None:
+            started = time.perf_counter()
+            voltage, delay_s = current
+            upcoming = next(setpoints, None)
+            # уровень следующей точки ставится в этой итерации, время идет в ее таймер
+            next_timer = PointTimer()
+            with timer.stage("modbus_cmd"):
+                await session.arm()
+            session.restart_ch2()
+            if settle is not None or multi:
+                # несколько отсчетов должны сняться до смены уровня
+                if settle is not None:
+                    with timer.stage("settle"):
+                        value, settle_s = await self._wait_settled(session.sample, settle)
+                    session.restart_ch2(keep_last=True)
+                else:
+                    settle_s = delay_s
+                    if delay_s > 0:
+                        with timer.stage("settle"):
+                            await asyncio.sleep(delay_s)
+                    with timer.stage("read"):
+                        value = await session.sample()
+                with timer.stage("read"):
+                    stats = await self._collect_samples(value, session.sample, sampling)
+                if upcoming is not None:
+                    with next_timer.stage("set_level"):
+                        await self._keithley_set_voltage(upcoming[0], smu)
+            else:
+                settle_s = delay_s
+                if delay_s > 0:
+                    with timer.stage("settle"):
+                        await asyncio.sleep(delay_s)
+                if upcoming is not None:
+                    value, _ = await asyncio.gather(
+                        timer.timed("read", session.read_peak()),
+                        next_timer.timed("set_level", self._keithley_set_voltage(upcoming[0], smu)),
+                    )
+                else:
+                    with timer.stage("read"):
+                        value = await session.read_peak()
+                stats = RunningStats.of([value])
+            session.record_latency(time.perf_counter() - started)
+            yield MeasurePoint(voltage, stats, "modbus_peak", settle_s, timer, session.take_ch2(), session.mpp_id)
+            current = upcoming
+            timer = next_timer
 
-    def _read_keithley_current_sync(self) -> float:
+    async def _measure_calibration_point(
+        self,
+        process: MPModel,
+        session: CalibrationSession,
+        voltage: float,
+        delay_s: float,
+    ) -> MeasurePoint:
+        timer = PointTimer()
+        arm_after_level = self._level_drops(voltage, process.smu_channel)
+        if not arm_after_level:
+            with timer.stage("modbus_cmd"):
+                await session.arm()
+        session.restart_ch2()
+        with timer.stage("set_level"):
+            await self._keithley_set_voltage(voltage, process.smu_channel)
+        if process.measure_settings.settle is None and delay_s > 0:
+            with timer.stage("settle"):
+                await asyncio.sleep(delay_s)
+        if arm_after_level:
+            with timer.stage("modbus_cmd"):
+                await session.arm()
+        stats, settle_s = await self._acquire_peak(process, session, timer, delay_s)
+        return MeasurePoint(voltage, stats, "modbus_peak", settle_s, timer, session.take_ch2(), session.mpp_id)
+
+    async def _measure_fanout_point(
+        self,
+        process: MPModel,
+        fanout: FanoutSession,
+        voltage: float,
+        delay_s: float,
+    ) -> list[MeasurePoint]:
+        # запуск, уровень и пауза - один раз на все МПП, затем пики каждого МПП
+        timer = PointTimer()
+        arm_after_level = self._level_drops(voltage, process.smu_channel)
+        if not arm_after_level:
+            with timer.stage("modbus_cmd"):
+                await fanout.arm()
+        with timer.stage("set_level"):
+            await self._keithley_set_voltage(voltage, process.smu_channel)
+        if process.measure_settings.settle is None and delay_s > 0:
+            with timer.stage("settle"):
+                await asyncio.sleep(delay_s)
+        if arm_after_level:
+            with timer.stage("modbus_cmd"):
+                await fanout.arm()
+
+        async def _acquire(session: CalibrationSession) -> MeasurePoint:
+            session.restart_ch2()
+            board_timer = PointTimer()
+            board_timer.started_ns = timer.started_ns
+            board_timer.stages.update(timer.stages)
+            stats, settle_s = await self._acquire_peak(process, session, board_timer, delay_s)
+            return MeasurePoint(
+                voltage, stats, "modbus_peak", settle_s, board_timer, session.take_ch2(), session.mpp_id, False
+            )
+
+        return await fanout.each(_acquire)
+
+    async def _acquire_peak(
+        self,
+        process: MPModel,
+        session: CalibrationSession,
+        timer: PointTimer,
+        delay_s: float,
+    ) -> tuple[RunningStats, float]:
+        """Отсчеты точки по уже запущенному измерению МПП: установление (если задано) и выборка."""
+        settle = process.measure_settings.settle
+        sampling = process.measure_settings.sampling
+        if settle is not None:
+            with timer.stage("settle"):
+                value, settle_s = await self._wait_settled(session.sample, settle)
+            session.restart_ch2(keep_last=True)
+        else:
+            settle_s = delay_s
+            multi = sampling is not None and sampling.samples_per_point > 1
+            with timer.stage("read"):
+                value = await (session.sample() if multi else session.read_peak())
+        with timer.stage("read"):
+            stats = await self._collect_samples(value, session.sample, sampling)
+        return stats, settle_s
+
+    async def _measure_keithley_current_point(
+        self,
+        voltage: float,
+        delay_s: float,
+        smu: str = "a",
+        settle: SettleSettings | None = None,
+        sampling: SamplingSettings | None = None,
+    ) -> MeasurePoint:
+        timer = PointTimer()
+        with timer.stage("set_level"):
+            await self._keithley_set_voltage(voltage, smu)
+
+        async def _sample() -> float:
+            return await self._keithley_io().call(self._read_keithley_current_sync, smu)
+
+        if settle is not None:
+            with timer.stage("settle"):
+                value, settle_s = await self._wait_settled(_sample, settle)
+        else:
+            settle_s = delay_s
+            if delay_s > 0:
+                with timer.stage("settle"):
+                    await asyncio.sleep(delay_s)
+            with timer.stage("read"):
+                value = await _sample()
+        with timer.stage("read"):
+            stats = await self._collect_samples(value, _sample, sampling)
+        return MeasurePoint(voltage, stats, "keithley_current_a", settle_s, timer)
+
+    async def _collect_samples(
+        self,
+        first: float,
+        sample: Callable[[], Awaitable[float]],
+        sampling: SamplingSettings | None,
+    ) -> RunningStats:
+        stats = RunningStats()
+        stats.push(first)
+        if sampling is None:
+            return stats
+        while stats.count < sampling.samples_per_point:
+            if (
+                sampling.target_sem is not None
+                and stats.count >= max(2, sampling.min_samples)
+                and stats.sem <= sampling.target_sem
+            ):
+                break
+            if sampling.sample_interval_s > 0:
+                await asyncio.sleep(sampling.sample_interval_s)
+            stats.push(await sample())
+        return stats
+
+    async def _wait_settled(
+        self,
+        sample: Callable[[], Awaitable[float]],
+        settle: SettleSettings,
+    ) -> tuple[float, float]:
+        window: deque[float] = deque(maxlen=max(2, int(settle.window)))
+        started = time.monotonic()
+        while True:
+            if settle.sample_interval_s > 0:
+                await asyncio.sleep(settle.sample_interval_s)
+            value = await sample()
+            window.append(value)
+            elapsed = time.monotonic() - started
+            if len(window) == window.maxlen:
+                limit = settle.tolerance + settle.rel_tolerance * abs(sum(window) / len(window))
+                if max(window) - min(window) <= limit:
+                    return value, elapsed
+            if elapsed >= settle.max_wait_s:
+                spread = max(window) - min(window)
+                if len(window) < window.maxlen:  # type: ignore[operator]
+                    # разброс по неполному окну (из одного отсчета - 0) не говорит об установлении
+                    logger.warning(
+                        f"Point not settled in {settle.max_wait_s:.3f} s: window never filled "
+                        f"({len(window)}/{window.maxlen} samples, spread {spread:.6g})"
+                    )
+                else:
+                    logger.warning(f"Point not settled in {settle.max_wait_s:.3f} s, spread {spread:.6g}")
+                return value, elapsed
+
+    def _smu(self, smu: str) -> Any:
         if self.k is None:
             raise RuntimeError("Keithley is not connected")
-        return float(self.k.smua.measure.i())
+        return getattr(self.k, f"smu{smu}")
 
-    async def _prepare_keithley_source(self, current_limit: float | None = None) -> None:
+    def _keithley_io(self) -> KeithleyIOWorker:
+        # VISA-сессия не потокобезопасна: все команды прибора идут через одну очередь
         if self.k is None:
             raise RuntimeError("Keithley is not connected")
+        return keithley_io(self.k)
 
-        def _prepare() -> None:
-            self.k.smua.source.func = self.k.smua.OUTPUT_DCVOLTS
-            self.k.smua.source.output = self.k.smua.OUTPUT_ON
-            if current_limit is not None:
-                self.k.smua.source.limiti = float(current_limit)
+    def _read_keithley_current_sync(self, smu: str = "a") -> float:
+        return float(self._smu(smu).measure.i())
 
-        await asyncio.to_thread(_prepare)
+    async def _prepare_keithley_source(self, current_limit: float | None = None, smu: str = "a") -> None:
+        attrs: dict[str, float | str] = {"func": "OUTPUT_DCVOLTS", "output": "OUTPUT_ON"}
+        if current_limit is not None:
+            attrs["limiti"] = float(current_limit)
+        await self._keithley_io().write(smu, **attrs)
 
-    async def _safe_keithley_output_off(self) -> None:
+    async def _safe_keithley_output_off(self, smu: str = "a") -> None:
         if self.k is None:
             return
-
-        def _off() -> None:
-            self.k.smua.source.output = self.k.smua.OUTPUT_OFF
-
         try:
-            await asyncio.to_thread(_off)
+            await self._keithley_io().write(smu, output="OUTPUT_OFF")
         except Exception as exc:
             logger.warning(f"Keithley output off error: {exc}")
 
-    async def _keithley_set_voltage(self, voltage: float) -> None:
-        if self.k is None:
-            raise RuntimeError("Keithley is not connected")
+    def _level_drops(self, voltage: float, smu: str = "a") -> bool:
+        """Уровень пойдет вниз или прежний неизвестен.
 
-        def _set() -> None:
-            self.k.smua.source.levelv = float(voltage)
+        Пиковый детектор МПП держит максимум с запуска: при понижении уровня
+        (адаптивные вставки, обратный/случайный порядок, переход к началу
+        следующего цикла) запуск нужен после смены уровня, иначе в точке
+        останется пик предыдущей, более высокой уставки.
+        """
+        previous = self._levels.get(smu)
+        return previous is None or voltage < previous
 
-        await asyncio.to_thread(_set)
-        logger.debug(f"Keithley level set: {voltage:.6f} V")
+    async def _keithley_set_voltage(self, voltage: float, smu: str = "a") -> None:
+        await self._keithley_io().write(smu, levelv=float(voltage))
+        self._levels[smu] = float(voltage)
+        logger.debug(f"Keithley smu{smu} level set: {voltage:.6f} V")
 
-    def _iter_setpoints(self, measure_settings: MeasureSettings) -> Iterator[tuple[float, float]]:
+    @staticmethod
+    def _compile_plan(measure_settings: MeasureSettings) -> SetpointPlan | None:
+        """Уставки режима измерения в прямом порядке; None для адаптивного режима."""
         if measure_settings.convince_mode is not None:
-            delay = float(measure_settings.convince_mode.step_delay_s)
-            for voltage in measure_settings.convince_mode.vg_lst:
-                yield float(voltage), delay
-            return
-
+            mode = measure_settings.convince_mode
+            return SetpointPlan.of(mode.vg_lst, mode.step_delay_s)
         if measure_settings.linspace_mode is not None:
-            start = float(measure_settings.linspace_mode.vg_start)
-            stop = float(measure_settings.linspace_mode.vg_stop)
-            points = max(1, int(measure_settings.linspace_mode.vg_step))
-            delay = float(measure_settings.linspace_mode.step_delay_s)
-            if points == 1:
-                yield start, delay
-                return
-            step = (stop - start) / (points - 1)
-            for index in range(points):
-                yield start + index * step, delay
-            return
-
+            linspace = measure_settings.linspace_mode
+            return linear_plan(linspace.vg_start, linspace.vg_stop, linspace.vg_step, linspace.step_delay_s)
+        if measure_settings.log_mode is not None:
+            log_mode = measure_settings.log_mode
+            return log_plan(log_mode.vg_start, log_mode.vg_stop, log_mode.points, log_mode.step_delay_s)
+        if measure_settings.file_mode is not None:
+            return load_plan(measure_settings.file_mode.path, measure_settings.file_mode.step_delay_s)
         if measure_settings.const_mode is not None:
-            yield float(measure_settings.const_mode.vg_cnst), 0.0
+            return SetpointPlan.of([measure_settings.const_mode.vg_cnst], 0.0)
+        return None
 
-    async def connect_modbus(self, modbus_settings: ModBusSettings) -> bool:
-        new_fp = (modbus_settings.com, int(modbus_settings.bodrate), float(modbus_settings.timeout_s))
+    async def connect_modbus(self, modbus_settings: ModBusSettings) -> AsyncModbusSerialClient | None:
+        com = modbus_settings.com
+        new_fp = (com, int(modbus_settings.bodrate), float(modbus_settings.timeout_s))
+        client = self.mb_clients.get(com)
         if (
-            self.mb_client is not None
-            and getattr(self.mb_client, "connected", False)
-            and self._active_modbus_fp == new_fp
+            client is not None
+            and getattr(client, "connected", False)
+            and self._active_modbus_fp.get(com, new_fp) == new_fp
         ):
-            return True
+            self._active_modbus_fp[com] = new_fp
+            return client
 
-        await self._close_modbus()
+        await self._close_modbus(com)
 
-        self.mb_client = AsyncModbusSerialClient(
-            port=modbus_settings.com,
+        client = AsyncModbusSerialClient(
+            port=com,
             timeout=float(modbus_settings.timeout_s),
             baudrate=int(modbus_settings.bodrate),
             bytesize=8,
@@ -345,26 +1313,28 @@ class MeasureProcessing:
             stopbits=1,
             handle_local_echo=True,
         )
-        connected: bool = await self.mb_client.connect()
+        connected: bool = await client.connect()
         if not connected:
-            self.mb_client.close()
-            self.mb_client = None
-            self._active_modbus_fp = None
-            return False
-        self._active_modbus_fp = new_fp
-        return True
-
-    async def _close_modbus(self) -> None:
-        if self.mb_client is not None:
+            client.close()
+            return None
+        self.mb_clients[com] = client
+        self._active_modbus_fp[com] = new_fp
+        return client
+
+    async def _close_modbus(self, com: str | None = None) -> None:
+        ports = [com] if com is not None else list(self.mb_clients)
+        for port in ports:
+            client = self.mb_clients.pop(port, None)
+            self._active_modbus_fp.pop(port, None)
+            if client is None:
+                continue
             try:
-                self.mb_client.close()
+                client.close()
             except Exception as exc:
-                logger.warning(f"Modbus close error: {exc}")
-        self.mb_client = None
-        self._active_modbus_fp = None
+                logger.warning(f"Modbus close error ({port}): {exc}")
 
     @staticmethod
-    def _extract_u16_value(raw: bytes) -> int:
+    def _extract_u16_values(raw: bytes) -> list[int]:
         if not raw:
             raise RuntimeError("Empty Modbus response")
         payload = raw
@@ -372,8 +1342,11 @@ class MeasureProcessing:
             payload = payload[1:]
         if len(payload) < 2:
             raise RuntimeError(f"Unexpected Modbus payload: {raw.hex()}")
-        regs = [int.from_bytes(payload[i : i + 2], byteorder="big") for i in range(0, len(payload), 2)]
-        return int(regs[-1])
+        return [int.from_bytes(payload[i : i + 2], byteorder="big") for i in range(0, len(payload), 2)]
+
+    @staticmethod
+    def _extract_u16_value(raw: bytes) -> int:
+        return MeasureProcessing._extract_u16_values(raw)[-1]
 
     @staticmethod
     def _sanitize_filename(name: str) -> str:
@@ -383,24 +1356,75 @@ class MeasureProcessing:
         return normalized or "measure"
 
 
-if __name__ == "__main__":
-    address = "10.6.1.222"
-    logger = log_init()
-    json_conf = Path(__file__).with_name("keithly_script.json")
-
+EXIT_OK = 0
+EXIT_CONNECTION = 1
+EXIT_CONFIG = 2
+EXIT_MEASURE = 3
+EXIT_INTERRUPTED = 130
+
+
+def _visa_resource(resource: str) -> str:
+    # голый IP-адрес - как раньше, прибор по LAN
+    if "::" in resource or is_sim_resource(resource):
+        return resource
+    return f"TCPIP0::{resource}::INSTR"
+
+
+def _parse_args(argv: list[str] | None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Измерения и калибровка МПП с Keithley 2600 без GUI")
+    parser.add_argument(
+        "--config",
+        type=Path,
+        default=Path(__file__).with_name("keithly_script.json"),
+        help="JSON с процессами измерения",
+    )
+    parser.add_argument(
+        "--resource", required=True, help="VISA-ресурс Keithley, IP-адрес или SIM::<модель> для симулятора"
+    )
+    parser.add_argument("--output-dir", type=Path, default=Path("measure"), help="каталог для результатов")
+    parser.add_argument("--resume", type=Path, help="продолжить прерванный запуск из каталога")
+    parser.add_argument("--live-plot", action="store_true", help="показывать окно графика во время измерения")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> int:
+    """Запуск из командной строки.
+
+    Коды выхода: 0 - успех, 1 - нет связи с Keithley, 2 - ошибка конфигурации,
+    3 - ошибка измерения, 130 - прервано пользователем.
+    """
+    args = _parse_args(argv)
+    log_init()
+
+    mp = MeasureProcessing(output_root=args.output_dir, live_plot=args.live_plot)
+    config = args.resume / CONFIG_SNAPSHOT if args.resume is not None else args.config
+    if not mp.load_config(config):
+        return EXIT_CONFIG
+
+    resource = _visa_resource(args.resource)
     try:
-        k: Keithley2600 | None = Keithley2600(f"TCPIP0::{address}::INSTR")  # type: ignore
-        logger.debug(f"Connected: TCPIP0::{address}::INSTR")
+        k = open_keithley(resource)
+        if not k.connected:
+            raise RuntimeError(f"no instrument at {resource}")
+        mp.k = k
+        logger.debug(f"Connected: {resource}")
     except Exception as exc:
-        k = None
         logger.error(f"Error connection keithley: {exc}")
-        raise SystemExit(1)
+        return EXIT_CONNECTION
 
     try:
-        mp = MeasureProcessing(k)
-        mp.load_config(json_conf)
-        asyncio.run(mp.run_process())
+        if args.resume is not None:
+            asyncio.run(mp.resume(args.resume))
+        else:
+            asyncio.run(mp.run_process())
     except KeyboardInterrupt:
         logger.warning("Measure interrupted by user")
+        return EXIT_INTERRUPTED
     except Exception as exc:
         logger.error(exc)
+        return EXIT_MEASURE
+    return EXIT_OK
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,88 @@
+"""
+Адаптивная развертка уставок.
+
+Сначала проходится грубая равномерная сетка, затем точки добавляются
+в середину интервала, где кривая сильнее всего изгибается или быстрее
+всего меняется, пока не достигнута точность или бюджет точек.
+"""
+import bisect
+from typing import Iterator
+
+import numpy as np
+
+
+class AdaptiveSweep:
+    """Планировщик уставок с обратной связью по измеренным значениям.
+
+    Итерация выдает напряжения; перед запросом следующей точки
+    результат текущей передается через record().
+    """
+
+    def __init__(
+        self,
+        start: float,
+        stop: float,
+        initial_points: int = 5,
+        max_points: int = 50,
+        tolerance: float = 0.01,
+        max_jump: float = 0.1,
+        min_step: float = 0.0,
+    ) -> None:
+        self.start = float(start)
+        self.stop = float(stop)
+        self.initial_points = max(2, int(initial_points))
+        self.max_points = max(self.initial_points, int(max_points))
+        self.tolerance = float(tolerance)
+        self.max_jump = float(max_jump)
+        self.min_step = float(min_step)
+        self._x: list[float] = []
+        self._y: list[float] = []
+
+    def __iter__(self) -> Iterator[float]:
+        for x in np.linspace(self.start, self.stop, self.initial_points):
+            if not self._has(float(x)):
+                yield float(x)
+        while len(self._x) < self.max_points:
+            x = self._next_point()
+            if x is None:
+                return
+            yield x
+
+    def record(self, x: float, y: float) -> None:
+        index = bisect.bisect_left(self._x, x)
+        self._x.insert(index, float(x))
+        self._y.insert(index, float(y))
+
+    def state(self) -> dict:
+        return {"x": list(self._x), "y": list(self._y)}
+
+    def restore(self, state: dict) -> None:
+        self._x, self._y = [], []
+        for x, y in zip(state.get("x", []), state.get("y", [])):
+            self.record(x, y)
+
+    def _has(self, x: float) -> bool:
+        index = bisect.bisect_left(self._x, x)
+        return index < len(self._x) and self._x[index] == x
+
+    def _next_point(self) -> float | None:
+        if len(self._x) < 2:
+            return None
+        x = np.asarray(self._x)
+        y = np.asarray(self._y)
+        span = float(np.ptp(y)) or 1.0
+        width = np.diff(x)
+        # изгиб: отклонение внутренней точки от хорды соседей
+        bend = np.zeros_like(x)
+        if x.size > 2:
+            t = (x[1:-1] - x[:-2]) / (x[2:] - x[:-2])
+            chord = y[:-2] + t * (y[2:] - y[:-2])
+            bend[1:-1] = np.abs(y[1:-1] - chord) / span
+        bend_score = np.maximum(bend[:-1], bend[1:]) / max(self.tolerance, 1e-12)
+        jump_score = np.abs(np.diff(y)) / span / max(self.max_jump, 1e-12)
+        score = np.maximum(bend_score, jump_score)
+        score[width / 2 < max(self.min_step, 1e-12)] = 0.0
+        best = int(np.argmax(score))
+        if score[best] <= 1.0:
+            return None
+        return float((x[best] + x[best + 1]) / 2)
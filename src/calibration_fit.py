@@ -0,0 +1,145 @@
+"""
+Инкрементальная полиномиальная аппроксимация калибровки.
+
+Вместо хранения точек копятся суммы нормальных уравнений МНК:
+sum(w*x^k) для k = 0..2*degree, sum(w*x^k*y) для k = 0..degree и
+sum(w*y^2). Обновление на точку - O(1) по числу точек, коэффициенты,
+остатки и R^2 считаются из сумм в любой момент.
+"""
+import json
+import math
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+COEFFS_SUFFIX = ".coeffs.json"
+
+
+class IncrementalPolyFit:
+    """МНК-полином y(x) степени degree по накопленным суммам."""
+
+    def __init__(self, degree: int = 1) -> None:
+        self.degree = max(0, int(degree))
+        self._powers = np.arange(2 * self.degree + 1)
+        self._sx = np.zeros(2 * self.degree + 1)
+        self._sxy = np.zeros(self.degree + 1)
+        self._syy = 0.0
+        self.n = 0
+        self.x_min = math.inf
+        self.x_max = -math.inf
+
+    def push(self, x: float, y: float, weight: float = 1.0) -> None:
+        if not (math.isfinite(x) and math.isfinite(y) and math.isfinite(weight)) or weight <= 0:
+            return
+        xp = float(x) ** self._powers
+        self._sx += weight * xp
+        self._sxy += weight * y * xp[: self.degree + 1]
+        self._syy += weight * y * y
+        self.n += 1
+        self.x_min = min(self.x_min, x)
+        self.x_max = max(self.x_max, x)
+
+    @property
+    def ready(self) -> bool:
+        return self.n > self.degree
+
+    def coefficients(self) -> np.ndarray:
+        """Коэффициенты от младшего к старшему: y = c0 + c1*x + ..."""
+        if not self.ready:
+            raise ValueError(f"Need more than {self.degree} points for degree {self.degree} fit")
+        coeffs, *_ = np.linalg.lstsq(self._normal(), self._sxy, rcond=None)
+        return coeffs
+
+    def _normal(self) -> np.ndarray:
+        index = np.arange(self.degree + 1)
+        return self._sx[index[:, None] + index[None, :]]
+
+    def result(self) -> dict[str, Any]:
+        """Коэффициенты, gain/offset, остатки и R^2 для файла коэффициентов."""
+        if not self.ready:
+            return {"n": self.n, "degree": self.degree, "error": "not enough points"}
+        c = self.coefficients()
+        sw = self._sx[0]
+        # SS_res = sum(w*y^2) - 2*c.T@Sxy + c.T@N@c, где N - матрица нормальных уравнений
+        d = self.degree
+        ss_res = max(float(self._syy - 2.0 * c @ self._sxy + c @ self._normal() @ c), 0.0)
+        mean_y = self._sxy[0] / sw
+        ss_tot = max(float(self._syy - sw * mean_y * mean_y), 0.0)
+        dof = self.n - (d + 1)
+        return {
+            "n": self.n,
+            "degree": d,
+            "coefficients": [float(v) for v in c],
+            "offset": float(c[0]),
+            "gain": float(c[1]) if d >= 1 else 0.0,
+            "residual_ss": ss_res,
+            "residual_rms": math.sqrt(ss_res / sw),
+            "residual_std": math.sqrt(ss_res / dof) if dof > 0 else None,
+            "r2": 1.0 - ss_res / ss_tot if ss_tot > 0 else None,
+            "x_min": self.x_min,
+            "x_max": self.x_max,
+        }
+
+    def state(self) -> dict[str, Any]:
+        return {
+            "degree": self.degree,
+            "sx": self._sx.tolist(),
+            "sxy": self._sxy.tolist(),
+            "syy": self._syy,
+            "n": self.n,
+            "x_min": self.x_min if self.n else None,
+            "x_max": self.x_max if self.n else None,
+        }
+
+    def restore(self, state: dict[str, Any]) -> None:
+        if int(state.get("degree", self.degree)) != self.degree:
+            return
+        self._sx = np.asarray(state["sx"], dtype=np.float64)
+        self._sxy = np.asarray(state["sxy"], dtype=np.float64)
+        self._syy = float(state["syy"])
+        self.n = int(state["n"])
+        if self.n:
+            self.x_min = float(state["x_min"])
+            self.x_max = float(state["x_max"])
+
+
+class ChannelFits:
+    """Аппроксимации по каналам АЦП (acq_channel) одного процесса."""
+
+    def __init__(self, degree: int = 1) -> None:
+        self.degree = degree
+        self.fits: dict[int, IncrementalPolyFit] = {}
+
+    def push(self, channel: int, x: float, y: float, weight: float = 1.0) -> None:
+        fit = self.fits.get(channel)
+        if fit is None:
+            fit = self.fits[channel] = IncrementalPolyFit(self.degree)
+        fit.push(x, y, weight)
+
+    def state(self) -> dict[str, Any]:
+        return {str(channel): fit.state() for channel, fit in self.fits.items()}
+
+    def restore(self, state: dict[str, Any] | None) -> None:
+        for channel, fit_state in (state or {}).items():
+            fit = self.fits[int(channel)] = IncrementalPolyFit(self.degree)
+            fit.restore(fit_state)
+
+    @staticmethod
+    def path_for(result_path: Path) -> Path:
+        return result_path.with_name(result_path.stem + COEFFS_SUFFIX)
+
+    def save(self, path: Path, meta: dict[str, Any]) -> None:
+        data = {
+            **meta,
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "model": "poly",
+            "x": "voltage_v",
+            "y": "value",
+            "channels": {str(channel): fit.result() for channel, fit in sorted(self.fits.items())},
+        }
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+        os.replace(tmp, path)
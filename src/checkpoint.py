@@ -0,0 +1,52 @@
+"""
+Контрольные точки процессов измерения.
+
+Состояние процесса (цикл, шаг, позиция в цикле, состояние планировщика
+и писателей) сохраняется атомарно в <name>.checkpoint.json рядом с
+результатами, каждый раз когда очередная пачка строк подтверждена на диске.
+"""
+import json
+import os
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any
+
+CHECKPOINT_SUFFIX = ".checkpoint.json"
+CONFIG_SNAPSHOT = "config.json"
+
+
+@dataclass
+class ProcessCheckpoint:
+    process_key: str
+    cycle: int = 0
+    # глобальный номер следующей строки
+    step: int = 0
+    # число точек, уже снятых в текущем цикле
+    index: int = 0
+    done: bool = False
+    planner: dict[str, Any] | None = None
+    writers: list[dict[str, Any]] = field(default_factory=list)
+    # суммы аппроксимации калибровки по каналам
+    fit: dict[str, Any] | None = None
+    # то же по адресам МПП, если процесс опрашивает несколько МПП
+    mpp_fits: dict[str, Any] | None = None
+    # зерно случайного порядка уставок, чтобы продолжение шло по тому же плану
+    plan_seed: int | None = None
+
+    @staticmethod
+    def path_for(result_path: Path) -> Path:
+        return result_path.with_name(result_path.stem + CHECKPOINT_SUFFIX)
+
+    def save(self, path: Path) -> None:
+        tmp = path.with_name(path.name + ".tmp")
+        with tmp.open("w", encoding="utf-8") as fh:
+            json.dump(asdict(self), fh, ensure_ascii=False)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "ProcessCheckpoint | None":
+        if not path.exists():
+            return None
+        return cls(**json.loads(path.read_text(encoding="utf-8")))
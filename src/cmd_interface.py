@@ -119,6 +119,11 @@ class MPP_Commands:
     async def get_acq2_peak(self) -> bytes:
         return await self._read(MPP_REG.ACQ2_PEAK, 1)
 
+    @mb_decorator()
+    async def get_acq_peaks(self) -> bytes:
+        # ACQ1_PEAK и ACQ2_PEAK идут подряд - оба пика одной транзакцией
+        return await self._read(MPP_REG.ACQ1_PEAK, 2)
+
     @mb_decorator()
     async def get_hh(self) -> bytes:
         return await self._read(MPP_REG.HH, 32)
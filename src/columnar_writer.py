@@ -0,0 +1,356 @@
+"""
+Колоночное хранение результатов измерений рядом с CSV.
+
+Форматы:
+"npy"     - каталог <name>.columns/ с отдельным .npy на каждую колонку;
+            данные дописываются группами строк, заголовок .npy
+            переписывается при каждом сбросе, файлы открываются через mmap.
+"parquet" - каталог <name>.parquet/ с файлами part-NNNNN.parquet,
+            каждая группа строк - отдельный файл (нужен pyarrow).
+            Файл пишется под временным именем и переименовывается после
+            закрытия, поэтому в каталоге только файлы с footer и его
+            читает pq.read_table даже после аварии.
+
+Строковые колонки хранятся кодами категорий (int32), словари лежат в
+_schema.json (имя с "_" pyarrow пропускает при чтении каталога).
+"""
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Literal, Sequence
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+try:
+    from .result_writer import ResultColumn
+except Exception:
+    from src.result_writer import ResultColumn
+
+# pyarrow импортируется только при первом обращении к parquet (_pyarrow)
+pa: Any = None
+pq: Any = None
+
+ColumnarFormat = Literal["npy", "parquet"]
+
+NPY_MAGIC = b"\x93NUMPY\x01\x00"
+NPY_HEADER_LEN = 128
+SCHEMA_FILE = "_schema.json"
+# имя словаря в каталогах, записанных до переименования
+LEGACY_SCHEMA_FILE = "schema.json"
+PARQUET_PART = "part-{:05d}.parquet"
+
+
+def _pyarrow() -> None:
+    """Импортировать pyarrow при первом использовании parquet."""
+    global pa, pq
+    if pq is not None:
+        return
+    try:
+        import pyarrow  # type: ignore
+        import pyarrow.parquet  # type: ignore
+    except Exception as exc:  # pragma: no cover - optional runtime dependency
+        raise RuntimeError("pyarrow is required for parquet output") from exc
+    pa, pq = pyarrow, pyarrow.parquet
+
+
+def _schema_path(path: Path) -> Path:
+    legacy = path / LEGACY_SCHEMA_FILE
+    return legacy if legacy.exists() and not (path / SCHEMA_FILE).exists() else path / SCHEMA_FILE
+
+
+def _parquet_parts(path: Path) -> list[Path]:
+    """Завершенные файлы данных parquet по порядку записи."""
+    parts = []
+    for part in path.glob("part-*.parquet"):
+        try:
+            parts.append((int(part.stem.split("-", 1)[1]), part))
+        except ValueError:
+            continue
+    return [part for _, part in sorted(parts)]
+
+
+def columnar_path(path: Path, fmt: ColumnarFormat) -> Path:
+    """Путь каталога колоночного результата для файла результата path."""
+    path = Path(path)
+    suffix = ".columns" if fmt == "npy" else ".parquet"
+    return path.with_name(path.stem + suffix)
+
+
+class _NpyColumn:
+    """Одна колонка в .npy с заголовком фиксированной длины."""
+
+    def __init__(self, path: Path, dtype: np.dtype, append: bool) -> None:
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.rows = 0
+        if append and path.exists():
+            self.rows = self.read_rows(path)
+            self._fh = path.open("r+b")
+        else:
+            self._fh = path.open("w+b")
+            self._write_header()
+
+    @staticmethod
+    def read_rows(path: Path) -> int:
+        with path.open("rb") as fh:
+            np.lib.format.read_magic(fh)
+            shape, _, _ = np.lib.format.read_array_header_1_0(fh)
+        return int(shape[0])
+
+    def truncate(self, rows: int) -> None:
+        self.rows = min(self.rows, rows)
+        self._fh.truncate(NPY_HEADER_LEN + self.rows * self.dtype.itemsize)
+        self._write_header()
+
+    def append(self, values: np.ndarray) -> None:
+        self._fh.seek(NPY_HEADER_LEN + self.rows * self.dtype.itemsize)
+        self._fh.write(np.ascontiguousarray(values, dtype=self.dtype).tobytes())
+        self.rows += len(values)
+
+    def sync(self) -> None:
+        self._write_header()
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+
+    def close(self) -> None:
+        self.sync()
+        self._fh.close()
+
+    def _write_header(self) -> None:
+        header = repr(
+            {
+                "descr": np.lib.format.dtype_to_descr(self.dtype),
+                "fortran_order": False,
+                "shape": (self.rows,),
+            }
+        ).encode("latin1")
+        body_len = NPY_HEADER_LEN - len(NPY_MAGIC) - 2
+        header = header.ljust(body_len - 1) + b"\n"
+        self._fh.seek(0)
+        self._fh.write(NPY_MAGIC + len(header).to_bytes(2, "little") + header)
+
+
+class ColumnarResultWriter:
+    """Потоковая запись результатов в колоночном виде группами строк."""
+
+    def __init__(
+        self,
+        path: Path,
+        columns: Sequence[ResultColumn],
+        fmt: ColumnarFormat = "npy",
+        group_rows: int = 1024,
+        flush_interval_s: float = 5.0,
+    ) -> None:
+        if fmt == "parquet":
+            _pyarrow()
+        self.fmt = fmt
+        self.columns = list(columns)
+        self.dir = columnar_path(path, fmt)
+        self.paths: list[Path] = [self.dir]
+        self.group_rows = max(1, int(group_rows))
+        self.flush_interval_s = max(0.0, float(flush_interval_s))
+        self.rows_total = 0
+        self._rows_on_disk = 0
+        self._pending: list[Sequence[Any]] = []
+        self._categories: dict[str, list[str]] = {}
+        self._npy: dict[str, _NpyColumn] = {}
+        self._next_part = 0
+        self._last_flush = time.monotonic()
+
+    def open(self, append: bool = False, state: dict[str, Any] | None = None) -> "ColumnarResultWriter":
+        """Открыть вывод; append - дописывать, state - продолжить с сохраненного state()."""
+        append = append or state is not None
+        self.dir.mkdir(parents=True, exist_ok=True)
+        schema = self._load_schema() if append else {}
+        self._categories = schema.get("categories", {})
+        if self.fmt == "npy":
+            for col in self.columns:
+                self._npy[col.name] = _NpyColumn(self.dir / f"{col.name}.npy", self._storage_dtype(col), append)
+            # после аварии колонки могли записаться на разную длину
+            rows = min((c.rows for c in self._npy.values()), default=0)
+            if state is not None:
+                rows = min(rows, int(state.get("rows", rows)))
+            for column in self._npy.values():
+                column.truncate(rows)
+            self._rows_on_disk = rows
+        else:
+            for tmp in self.dir.glob("*.parquet.tmp"):
+                # файл без footer от прерванной записи
+                tmp.unlink()
+            if not append:
+                for part in _parquet_parts(self.dir):
+                    part.unlink()
+            # при продолжении строки после контрольной точки отбрасываются, иначе задвоятся
+            saved_rows = None if state is None or "rows" not in state else int(state["rows"])
+            self._rows_on_disk = self._trim_parquet(_parquet_parts(self.dir), saved_rows)
+            parts = _parquet_parts(self.dir)
+            self._next_part = int(parts[-1].stem.split("-", 1)[1]) + 1 if parts else 0
+        self._save_schema()
+        self._last_flush = time.monotonic()
+        return self
+
+    def write(self, row: Sequence[Any]) -> None:
+        self._pending.append(row)
+        if (
+            len(self._pending) >= self.group_rows
+            or time.monotonic() - self._last_flush >= self.flush_interval_s
+        ):
+            self.flush()
+
+    def flush(self) -> None:
+        self._last_flush = time.monotonic()
+        if not self._pending:
+            return
+        rows, self._pending = self._pending, []
+        arrays = {
+            col.name: self._to_array(col, [row[i] for row in rows])
+            for i, col in enumerate(self.columns)
+        }
+        if self.fmt == "npy":
+            for name, values in arrays.items():
+                self._npy[name].append(values)
+            for column in self._npy.values():
+                column.sync()
+        else:
+            self._write_part(pa.table(arrays, schema=self._arrow_schema()))
+        self.rows_total += len(rows)
+        self._rows_on_disk += len(rows)
+        self._save_schema()
+
+    def state(self) -> dict[str, Any]:
+        """Число строк на диске для контрольной точки."""
+        return {"rows": self._rows_on_disk}
+
+    def close(self) -> None:
+        try:
+            self.flush()
+        finally:
+            for column in self._npy.values():
+                column.close()
+            self._npy.clear()
+        logger.info(f"Columnar writer {self.dir.name}: {self.rows_total} rows ({self.fmt})")
+
+    def __enter__(self) -> "ColumnarResultWriter":
+        return self.open()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def _write_part(self, table: Any) -> None:
+        path = self.dir / PARQUET_PART.format(self._next_part)
+        tmp = path.with_name(path.name + ".tmp")
+        pq.write_table(table, tmp)
+        with tmp.open("rb") as fh:
+            os.fsync(fh.fileno())
+        os.replace(tmp, path)
+        self._next_part += 1
+
+    def _trim_parquet(self, parts: list[Path], rows: int | None) -> int:
+        """Оставить в файлах не больше rows строк (None - все); вернуть число строк."""
+        kept = 0
+        for part in parts:
+            part_rows = pq.ParquetFile(part).metadata.num_rows
+            if rows is None or kept + part_rows <= rows:
+                kept += part_rows
+                continue
+            keep = max(0, rows - kept)
+            if keep:
+                tmp = part.with_name(part.name + ".tmp")
+                pq.write_table(pq.read_table(part).slice(0, keep), tmp)
+                os.replace(tmp, part)
+            else:
+                part.unlink()
+            kept += keep
+        return kept
+
+    @staticmethod
+    def _is_category(col: ResultColumn) -> bool:
+        return col.dtype in ("str", "object")
+
+    def _storage_dtype(self, col: ResultColumn) -> np.dtype:
+        return np.dtype(np.int32) if self._is_category(col) else np.dtype(col.dtype)
+
+    def _to_array(self, col: ResultColumn, values: list[Any]) -> np.ndarray:
+        if not self._is_category(col):
+            return np.asarray(values, dtype=col.dtype)
+        categories = self._categories.setdefault(col.name, [])
+        index = {name: code for code, name in enumerate(categories)}
+        codes = np.empty(len(values), dtype=np.int32)
+        for i, value in enumerate(values):
+            key = str(value)
+            code = index.get(key)
+            if code is None:
+                code = index[key] = len(categories)
+                categories.append(key)
+            codes[i] = code
+        return codes
+
+    def _arrow_schema(self) -> Any:
+        fields = []
+        for col in self.columns:
+            if self._is_category(col):
+                fields.append(pa.field(col.name, pa.int32()))
+            else:
+                fields.append(pa.field(col.name, pa.from_numpy_dtype(np.dtype(col.dtype))))
+        return pa.schema(fields)
+
+    def _load_schema(self) -> dict:
+        path = _schema_path(self.dir)
+        if not path.exists():
+            return {}
+        return json.loads(path.read_text(encoding="utf-8"))
+
+    def _save_schema(self) -> None:
+        schema = {
+            "format": self.fmt,
+            "columns": {col.name: col.dtype for col in self.columns},
+            "categories": self._categories,
+        }
+        tmp = self.dir / (SCHEMA_FILE + ".tmp")
+        tmp.write_text(json.dumps(schema, ensure_ascii=False, indent=2), encoding="utf-8")
+        os.replace(tmp, self.dir / SCHEMA_FILE)
+        legacy = self.dir / LEGACY_SCHEMA_FILE
+        if legacy.exists():
+            legacy.unlink()
+
+
+def load_columns(path: Path, columns: Sequence[str] | None = None, mmap: bool = True) -> dict[str, np.ndarray]:
+    """Загрузить выбранные колонки колоночного результата.
+
+    Для "npy" массивы открываются через mmap и не читаются в память целиком,
+    строковые колонки возвращаются кодами (словарь - в _schema.json).
+    """
+    path = Path(path)
+    schema = json.loads(_schema_path(path).read_text(encoding="utf-8"))
+    names = list(columns) if columns is not None else list(schema["columns"])
+    if schema["format"] == "npy":
+        if mmap:
+            return {name: np.load(path / f"{name}.npy", mmap_mode="r") for name in names}
+        return {name: np.load(path / f"{name}.npy") for name in names}
+    _pyarrow()
+    parts = _parquet_parts(path)
+    if not parts:
+        return {
+            name: np.empty(0, dtype=np.int32 if schema["columns"][name] in ("str", "object") else schema["columns"][name])
+            for name in names
+        }
+    table = pa.concat_tables([pq.read_table(part, columns=names) for part in parts])
+    return {name: table.column(name).to_numpy() for name in names}
+
+
+def read_result_frame(path: Path, columns: Sequence[str] | None = None) -> pd.DataFrame:
+    """Прочитать колоночный результат в DataFrame, строковые колонки - category."""
+    path = Path(path)
+    schema = json.loads(_schema_path(path).read_text(encoding="utf-8"))
+    data = load_columns(path, columns, mmap=True)
+    frame = {}
+    for name, values in data.items():
+        categories = schema["categories"].get(name)
+        if categories is not None:
+            frame[name] = pd.Categorical.from_codes(np.asarray(values), categories=categories)
+        else:
+            frame[name] = values
+    return pd.DataFrame(frame)
@@ -22,6 +22,8 @@ class MPP_REG(IntEnum):
 
 class MPP_CMD_REG(IntEnum):
     SET_LEVEL = 0x0001
+    # аргумент 1 - запуск измерения, 0 - остановка
+    START_MEASURE = 0x0002
     SET_HH = 0x0008
     WAVEFORM_RELEASE = 0x0009
     FILTER_BYPASS = 0x000A
@@ -31,8 +33,8 @@ class MPP_CMD_REG(IntEnum):
 
 @dataclass(frozen=True)
 class MPP_CMD_Payload:
-    START_MEASURE: list[int] = field(default_factory=lambda: [0x0002, 0x0001])
-    STOP_MEASURE: list[int] = field(default_factory=lambda: [0x0002, 0x0000])
+    START_MEASURE: list[int] = field(default_factory=lambda: [int(MPP_CMD_REG.START_MEASURE), 0x0001])
+    STOP_MEASURE: list[int] = field(default_factory=lambda: [int(MPP_CMD_REG.START_MEASURE), 0x0000])
 
 
 class MB_F_CODE(IntEnum):
@@ -0,0 +1,205 @@
+"""
+Поток ввода-вывода Keithley 2600 с очередью команд.
+
+Все обращения к прибору идут через один поток на прибор: команды разных
+вызывающих не перемешиваются, а подряд стоящие в очереди присваивания
+атрибутов source (func, output, limiti, levelv) уходят одной TSP-строкой
+через connection.write вместо отдельного обмена на каждый атрибут.
+Чтения и произвольные вызовы (measure.i, TSP-развертка) выполняются по
+одному и служат границей пачки.
+
+Глубина очереди и задержка команды (от постановки до выполнения)
+доступны через stats() / summary().
+"""
+import asyncio
+import concurrent.futures
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+from loguru import logger
+
+try:
+    from .running_stats import RunningStats
+except Exception:
+    from src.running_stats import RunningStats
+
+MAX_BATCH = 32
+
+
+@dataclass
+class _Command:
+    future: concurrent.futures.Future
+    # присваивания (smu, атрибут source, значение) или вызов func
+    assignments: list[tuple[str, str, float | str]] = field(default_factory=list)
+    func: Callable[[], Any] | None = None
+    submitted_ns: int = field(default_factory=time.perf_counter_ns)
+
+
+class KeithleyIOWorker:
+    """Очередь команд одного прибора, исполняемая в отдельном потоке.
+
+    Значение присваивания - число или имя константы SMU ("OUTPUT_ON"),
+    которая в TSP пишется как smua.OUTPUT_ON. tsp_batching=False (или
+    прибор без connection) - присваивания выполняются по одному через
+    атрибуты объекта прибора.
+    """
+
+    def __init__(self, k: Any, tsp_batching: bool | None = None, max_batch: int = MAX_BATCH) -> None:
+        self.k = k
+        self.tsp_batching = hasattr(k, "connection") if tsp_batching is None else tsp_batching
+        self.max_batch = max(1, int(max_batch))
+        # None в очереди - остановка потока
+        self._queue: queue.Queue[_Command | None] = queue.Queue()
+        self.max_depth = 0
+        self.batches = 0
+        self.coalesced = 0
+        self.latency_us = {"write": RunningStats(), "call": RunningStats()}
+        self._thread = threading.Thread(target=self._run, name="keithley_io", daemon=True)
+        self._thread.start()
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    @property
+    def running(self) -> bool:
+        return self._thread.is_alive()
+
+    def submit_write(self, smu: str, **attrs: float | str) -> concurrent.futures.Future:
+        """Поставить присваивания smu<smu>.source.<attr> = value одной командой."""
+        return self._submit(_Command(concurrent.futures.Future(), [(smu, a, v) for a, v in attrs.items()]))
+
+    def submit_call(self, func: Callable[..., Any], *args: Any) -> concurrent.futures.Future:
+        return self._submit(_Command(concurrent.futures.Future(), func=lambda: func(*args)))
+
+    async def write(self, smu: str, **attrs: float | str) -> None:
+        await asyncio.wrap_future(self.submit_write(smu, **attrs))
+
+    async def call(self, func: Callable[..., Any], *args: Any) -> Any:
+        return await asyncio.wrap_future(self.submit_call(func, *args))
+
+    def close(self, timeout_s: float = 5.0) -> None:
+        if self.running:
+            self._queue.put(None)
+            self._thread.join(timeout_s)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "batches": self.batches,
+            "coalesced": self.coalesced,
+            **{
+                f"{kind}_latency_us": {"n": s.count, "mean": s.mean, "max": s.max if s.count else 0.0}
+                for kind, s in self.latency_us.items()
+            },
+        }
+
+    def summary(self) -> str:
+        parts = [f"max depth {self.max_depth}", f"{self.batches} write batches ({self.coalesced} coalesced)"]
+        for kind, s in self.latency_us.items():
+            if s.count:
+                parts.append(f"{kind} n={s.count} mean {s.mean:.0f} us max {s.max:.0f} us")
+        return ", ".join(parts)
+
+    def _submit(self, command: _Command) -> concurrent.futures.Future:
+        if not self.running:
+            raise RuntimeError("Keithley I/O worker is stopped")
+        self._queue.put(command)
+        self.max_depth = max(self.max_depth, self._queue.qsize())
+        return command.future
+
+    def _run(self) -> None:
+        carry: _Command | None = None
+        stop = False
+        while not stop:
+            command = carry if carry is not None else self._queue.get()
+            carry = None
+            if command is None:
+                return
+            if command.func is not None:
+                self._finish_safe([command], "call", command.func)
+                continue
+            # присваивания, уже стоящие в очереди следом, уходят той же пачкой
+            batch = [command]
+            while len(batch) < self.max_batch:
+                try:
+                    following = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if following is None:
+                    stop = True
+                    break
+                if following.func is not None:
+                    carry = following
+                    break
+                batch.append(following)
+            self._finish_safe(batch, "write", lambda: self._send(batch))
+
+    def _finish_safe(self, batch: list[_Command], kind: str, action: Callable[[], Any]) -> None:
+        # ни одна ошибка команды не должна остановить поток: за ней в очереди
+        # может стоять отключение выхода
+        try:
+            self._finish(batch, kind, action)
+        except BaseException as exc:
+            logger.error(f"Keithley I/O worker: {kind} command dropped: {exc!r}")
+
+    def _finish(self, batch: list[_Command], kind: str, action: Callable[[], Any]) -> None:
+        # отмененные до начала команды (Stop, wait_for) не выполняются; после
+        # set_running_or_notify_cancel future уже нельзя отменить, и результат
+        # всегда можно выставить - поток не падает на InvalidStateError
+        batch[:] = [command for command in batch if command.future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        try:
+            result = action()
+        except BaseException as exc:
+            logger.warning(f"Keithley I/O {kind} failed: {exc!r}")
+            for command in batch:
+                command.future.set_exception(exc)
+            return
+        done_ns = time.perf_counter_ns()
+        for command in batch:
+            self.latency_us[kind].push((done_ns - command.submitted_ns) / 1e3)
+            command.future.set_result(result if kind == "call" else None)
+
+    def _send(self, batch: list[_Command]) -> None:
+        assignments = [item for command in batch for item in command.assignments]
+        if not assignments:
+            return
+        self.batches += 1
+        self.coalesced += len(batch) - 1
+        if self.tsp_batching:
+            self.k.connection.write(" ".join(self._tsp(*item) for item in assignments))
+            return
+        for smu, attr, value in assignments:
+            channel = getattr(self.k, f"smu{smu}")
+            setattr(channel.source, attr, getattr(channel, value) if isinstance(value, str) else value)
+
+    @staticmethod
+    def _tsp(smu: str, attr: str, value: float | str) -> str:
+        expr = f"smu{smu}.{value}" if isinstance(value, str) else f"{float(value):.9g}"
+        return f"smu{smu}.source.{attr} = {expr}"
+
+
+_workers: dict[int, KeithleyIOWorker] = {}
+_workers_lock = threading.Lock()
+
+
+def keithley_io(k: Any) -> KeithleyIOWorker:
+    """Общий поток ввода-вывода для объекта прибора (один на прибор в процессе)."""
+    with _workers_lock:
+        worker = _workers.get(id(k))
+        if worker is None or worker.k is not k or not worker.running:
+            worker = _workers[id(k)] = KeithleyIOWorker(k)
+        return worker
+
+
+def close_keithley_io(k: Any) -> None:
+    with _workers_lock:
+        worker = _workers.pop(id(k), None)
+    if worker is not None:
+        worker.close()
@@ -0,0 +1,162 @@
+"""
+Импульсы Keithley 2600 по таймерам прибора.
+
+Серия импульсов (уровень, длительность, период, число или непрерывно)
+загружается в trigger model SMU одним TSP-скриптом: trigger.timer[1]
+задает период, trigger.timer[2] - длительность импульса, по его событию
+endpulse возвращает выход на 0 В. Длительности определяются таймерами
+прибора, а не задержками VISA и event loop; хост только запускает
+серию, останавливает ее и забирает токи, измеренные на каждом импульсе.
+
+В непрерывном режиме буфер работает окном (FILL_WINDOW) и его n перестает
+расти после заполнения, поэтому прогресс считает функция <имя>_done(),
+которую определяет скрипт: она прибавляет к счетчику число периодов между
+метками времени последнего отсчета при соседних опросах.
+"""
+from dataclasses import dataclass
+from typing import Any
+
+TSP_PULSE_SCRIPT_NAME = "kc_pulse"
+
+
+@dataclass(frozen=True)
+class PulseTrain:
+    """Параметры серии импульсов; count=None - непрерывно до stop()."""
+
+    level_v: float
+    width_s: float
+    period_s: float
+    count: int | None = None
+    limit_i: float | None = None
+    # время интегрирования измерения тока на импульсе, в периодах сети
+    nplc: float = 0.001
+
+    def __post_init__(self) -> None:
+        if self.width_s <= 0:
+            raise ValueError(f"Pulse width must be positive: {self.width_s}")
+        if self.period_s < self.width_s:
+            raise ValueError(f"Pulse period {self.period_s} s is shorter than width {self.width_s} s")
+        if self.count is not None and self.count < 1:
+            raise ValueError(f"Pulse count must be positive: {self.count}")
+
+    @property
+    def duration_s(self) -> float | None:
+        return None if self.count is None else self.count * self.period_s
+
+
+class TspPulseScript:
+    """Генератор текста TSP-скрипта серии импульсов."""
+
+    def __init__(self, smu: str = "smua", name: str = TSP_PULSE_SCRIPT_NAME) -> None:
+        self.smu = smu
+        self.name = name
+
+    def compile(self, train: PulseTrain) -> list[str]:
+        smu = self.smu
+        continuous = train.count is None
+        lines = [
+            f"loadscript {self.name}",
+            f"{smu}.abort()",
+            f"{smu}.source.func = {smu}.OUTPUT_DCVOLTS",
+            f"{smu}.source.levelv = 0",
+            f"{smu}.source.limiti = {train.limit_i:.9g}" if train.limit_i is not None else "",
+            f"{smu}.measure.nplc = {train.nplc:.9g}",
+            f"{smu}.measure.delay = 0",
+            f"{smu}.nvbuffer1.clear()",
+            f"{smu}.nvbuffer1.appendmode = 1",
+            f"{smu}.nvbuffer1.fillmode = {smu}.FILL_WINDOW" if continuous else "",
+            f"{smu}.nvbuffer1.collecttimestamps = 1" if continuous else "",
+            *(self._done_function(train) if continuous else []),
+            # список из одной уставки повторяется на каждом срабатывании
+            f"{smu}.trigger.source.listv({{{train.level_v:.9g}}})",
+            f"{smu}.trigger.source.action = {smu}.ENABLE",
+            f"{smu}.trigger.measure.i({smu}.nvbuffer1)",
+            f"{smu}.trigger.measure.action = {smu}.ENABLE",
+            f"{smu}.trigger.endpulse.action = {smu}.SOURCE_IDLE",
+            # период: первый импульс сразу (passthrough), остальные по таймеру
+            f"trigger.timer[1].delay = {train.period_s:.9g}",
+            f"trigger.timer[1].count = {0 if continuous else max(train.count - 1, 1)}",  # type: ignore[operator]
+            "trigger.timer[1].passthrough = true",
+            f"trigger.timer[1].stimulus = {smu}.trigger.ARMED_EVENT_ID",
+            # длительность: от окончания установки уровня до endpulse
+            f"trigger.timer[2].delay = {train.width_s:.9g}",
+            "trigger.timer[2].count = 1",
+            "trigger.timer[2].passthrough = false",
+            f"trigger.timer[2].stimulus = {smu}.trigger.SOURCE_COMPLETE_EVENT_ID",
+            f"{smu}.trigger.source.stimulus = trigger.timer[1].EVENT_ID",
+            f"{smu}.trigger.endpulse.stimulus = trigger.timer[2].EVENT_ID",
+            f"{smu}.trigger.arm.count = 1",
+            f"{smu}.trigger.count = {0 if continuous else train.count}",
+            f"{smu}.source.output = {smu}.OUTPUT_ON",
+            f"{smu}.trigger.initiate()",
+            "endscript",
+        ]
+        return [line for line in lines if line]
+
+    def _done_function(self, train: PulseTrain) -> list[str]:
+        # счетчик растет и после заполнения окна буфера: число импульсов между
+        # опросами - разность меток времени последнего отсчета в периодах
+        smu, name = self.smu, self.name
+        return [
+            f"{name}_n = 0",
+            f"{name}_ts = nil",
+            f"function {name}_done()"
+            f" local b = {smu}.nvbuffer1 local n = b.n"
+            f" if n == 0 then return {name}_n end"
+            " local ts = b.timestamps[n]"
+            f" if {name}_ts == nil then {name}_n = n"
+            f" elseif ts > {name}_ts then {name}_n = {name}_n + math.floor((ts - {name}_ts) / {train.period_s:.9g} + 0.5)"
+            f" end {name}_ts = ts return {name}_n end",
+        ]
+
+    def progress_expr(self, continuous: bool = False) -> str:
+        if continuous:
+            return f"print({self.name}_done())"
+        return f"print({self.smu}.nvbuffer1.n)"
+
+    def fetch_expr(self) -> str:
+        smu = self.smu
+        return f"printbuffer(1, {smu}.nvbuffer1.n, {smu}.nvbuffer1.readings)"
+
+    def stop_line(self) -> str:
+        return f"{self.smu}.abort() {self.smu}.source.levelv = 0"
+
+
+class TspPulseEngine:
+    """Запуск, остановка и опрос серии импульсов на приборе.
+
+    Работает поверх VISA-сессии keithley2600 (атрибут connection),
+    методы синхронные - вызываются через KeithleyIOWorker.
+    """
+
+    def __init__(self, k: Any, smu: str = "smua") -> None:
+        self.k = k
+        self.script = TspPulseScript(smu=smu)
+        self._loaded: list[str] | None = None
+        self._continuous = False
+
+    def start(self, train: PulseTrain) -> None:
+        conn = self.k.connection
+        lines = self.script.compile(train)
+        if lines != self._loaded:
+            for line in lines:
+                conn.write(line)
+            self._loaded = lines
+        self._continuous = train.count is None
+        # initiate() возвращает управление сразу, импульсы идут по таймерам прибора
+        conn.write(f"{self.script.name}()")
+
+    def progress(self) -> int:
+        """Число импульсов, по которым уже есть отсчет тока (не ограничено окном буфера)."""
+        return int(float(self.k.connection.query(self.script.progress_expr(self._continuous))))
+
+    def readings(self) -> list[float]:
+        raw = self.k.connection.query(self.script.fetch_expr())
+        return [float(item) for item in raw.replace("\n", ",").split(",") if item.strip()]
+
+    def stop(self) -> None:
+        self.k.connection.write(self.script.stop_line())
+
+    @staticmethod
+    def finished(train: PulseTrain, done: int) -> bool:
+        return train.count is not None and done >= train.count
@@ -0,0 +1,364 @@
+"""
+Симулятор Keithley 2600 для запуска измерений без прибора.
+
+Повторяет ту часть интерфейса keithley2600.Keithley2600, которой
+пользуются MeasureProcessing и Keithley2600Client: smua/smub.source
+(levelv, output, func, limiti), smuX.measure.i(), константы OUTPUT_*,
+connected и connection с write/query для TSP-развертки (TspSweepEngine),
+серии импульсов по таймерам (TspPulseEngine) и пачек присваиваний source
+одной строкой (KeithleyIOWorker).
+
+Выбирается строкой ресурса "SIM::<модель>[::ключ=значение,...]",
+например "SIM::2611B::latency_ms=1,load_ohm=1000,tau_ms=5".
+"""
+import math
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass, fields
+from typing import Any
+
+SIM_RESOURCE_PREFIX = "SIM::"
+# буфер токов непрерывной серии импульсов (FILL_WINDOW)
+SIM_PULSE_WINDOW = 10_000
+# присваивание атрибута source в TSP-строке: smua.source.levelv = 1.5 / smua.OUTPUT_ON
+_ASSIGN_RE = re.compile(r"(smu[ab])\.source\.(levelv|output|func|limiti)\s*=\s*(smu[ab]\.\w+|[-+\d.eE]+)")
+
+
+@dataclass
+class SimKeithleySettings:
+    """Нагрузка на выходе SMU и тайминги симулятора."""
+
+    model: str = "2611B"
+    # задержка на каждую команду (установка/чтение атрибута, измерение)
+    latency_s: float = 0.0
+    # нагрузка: ток = U / load_ohm, ограничивается limiti
+    load_ohm: float = 10_000.0
+    noise_a: float = 0.0
+    # постоянная времени установления тока после смены уровня
+    tau_s: float = 0.0
+    # множитель для delay() в TSP-скрипте, 0 - не ждать
+    time_scale: float = 1.0
+    seed: int | None = None
+
+    @classmethod
+    def from_resource(cls, resource: str) -> "SimKeithleySettings":
+        """Разобрать строку ресурса SIM::<модель>::ключ=значение,..."""
+        parts = resource[len(SIM_RESOURCE_PREFIX):].split("::")
+        settings = cls(model=parts[0] or cls.model)
+        names = {f.name for f in fields(cls)}
+        for item in ",".join(parts[1:]).split(","):
+            if not item.strip():
+                continue
+            key, _, value = item.partition("=")
+            key = key.strip()
+            # *_ms задаются в миллисекундах, хранятся в секундах
+            if key.endswith("_ms"):
+                key, scale = key[:-3] + "_s", 1e-3
+            else:
+                scale = 1.0
+            if key not in names or key == "model":
+                raise ValueError(f"Unknown simulator option: {item}")
+            if key == "seed":
+                setattr(settings, key, int(value))
+            else:
+                setattr(settings, key, float(value) * scale)
+        return settings
+
+
+class _SimChannel:
+    """Состояние одного SMU, общее для source и measure."""
+
+    def __init__(self, settings: SimKeithleySettings, rng: random.Random) -> None:
+        self.settings = settings
+        self.rng = rng
+        self.levelv = 0.0
+        self.output = 0
+        self.func = 1
+        self.limiti = 0.1
+        self.lock = threading.Lock()
+        self._prev_i = 0.0
+        self._changed_at = time.monotonic()
+
+    def target_current(self) -> float:
+        if not self.output:
+            return 0.0
+        current = self.levelv / self.settings.load_ohm
+        return max(-self.limiti, min(self.limiti, current))
+
+    def changed(self) -> None:
+        # ток в момент смены уровня - начальная точка переходного процесса
+        self._prev_i = self.current(noise=False)
+        self._changed_at = time.monotonic()
+
+    def current(self, noise: bool = True) -> float:
+        target = self.target_current()
+        value = target
+        if self.settings.tau_s > 0:
+            elapsed = time.monotonic() - self._changed_at
+            value = target + (self._prev_i - target) * math.exp(-elapsed / self.settings.tau_s)
+        if noise and self.settings.noise_a > 0:
+            value += self.rng.gauss(0.0, self.settings.noise_a)
+        return value
+
+
+class SimSource:
+    _ATTRS = ("levelv", "output", "func", "limiti")
+
+    def __init__(self, channel: _SimChannel, latency: Any) -> None:
+        object.__setattr__(self, "_channel", channel)
+        object.__setattr__(self, "_latency", latency)
+
+    def __getattr__(self, name: str) -> Any:
+        if name not in self._ATTRS:
+            raise AttributeError(name)
+        self._latency()
+        return getattr(self._channel, name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        if name not in self._ATTRS:
+            raise AttributeError(f"Simulated source has no attribute {name}")
+        self._latency()
+        with self._channel.lock:
+            setattr(self._channel, name, float(value) if name in ("levelv", "limiti") else int(value))
+            self._channel.changed()
+
+
+class SimMeasure:
+    def __init__(self, channel: _SimChannel, latency: Any) -> None:
+        self._channel = channel
+        self._latency = latency
+
+    def i(self) -> float:
+        self._latency()
+        return self._channel.current()
+
+    def v(self) -> float:
+        self._latency()
+        return self._channel.levelv if self._channel.output else 0.0
+
+
+class SimSmu:
+    OUTPUT_DCAMPS = 0
+    OUTPUT_DCVOLTS = 1
+    OUTPUT_OFF = 0
+    OUTPUT_ON = 1
+
+    def __init__(self, channel: _SimChannel, latency: Any) -> None:
+        self.channel = channel
+        self.source = SimSource(channel, latency)
+        self.measure = SimMeasure(channel, latency)
+
+    @property
+    def output_voltage(self) -> float:
+        """Напряжение на выходе без задержки команды (для эмулятора МПП)."""
+        return self.channel.levelv if self.channel.output else 0.0
+
+
+class SimConnection:
+    """VISA-сессия симулятора: *IDN?, загрузка и запуск скрипта развертки."""
+
+    def __init__(self, k: "SimulatedKeithley2600") -> None:
+        self.k = k
+        self.timeout = 2000
+        self._script: list[str] | None = None
+        self._script_name = ""
+        self._scripts: dict[str, list[str]] = {}
+        self._buffers: dict[str, list[float]] = {}
+        # число импульсов с отсчетом, как <имя>_done() скрипта серии
+        self._pulses_done = 0
+        self._pulse_thread: threading.Thread | None = None
+        self._pulse_abort = threading.Event()
+
+    def write(self, line: str) -> None:
+        self.k._latency()
+        line = line.strip()
+        if self._script is not None:
+            if line == "endscript":
+                self._scripts[self._script_name] = self._script
+                self._script = None
+            else:
+                self._script.append(line)
+            return
+        if line.startswith("loadscript "):
+            self._script_name = line.split()[1]
+            self._script = []
+            return
+        call = re.fullmatch(r"(\w+)\(\)", line)
+        if call and call.group(1) in self._scripts:
+            script = self._scripts[call.group(1)]
+            if any("trigger.timer" in item for item in script):
+                self._start_pulses(script)
+            else:
+                self._run_sweep(script)
+            return
+        abort = re.match(r"smu[ab]\.abort\(\)\s*", line)
+        if abort:
+            self._abort_pulses()
+            line = line[abort.end() :]
+            if not line:
+                return
+        if re.fullmatch(r"smu[ab]\.measure\.count = \d+", line):
+            # число отсчетов задается скриптом развертки, вне его не моделируется
+            return
+        if _ASSIGN_RE.match(line) and not _ASSIGN_RE.sub("", line).strip():
+            self._assign(_ASSIGN_RE.findall(line))
+            return
+        raise ValueError(f"Simulated Keithley cannot execute: {line}")
+
+    def read(self) -> str:
+        raise ValueError("Simulated Keithley has no pending output")
+
+    def query(self, line: str) -> str:
+        self.k._latency()
+        line = line.strip()
+        if line == "*IDN?":
+            return f"Keithley Instruments Inc., Model {self.k.settings.model}, SIM0001, 0.0.0\n"
+        if re.fullmatch(r"print\(\w+_done\(\)\)", line):
+            return f"{self._pulses_done}\n"
+        count = re.fullmatch(r"print\((\w+)\.nvbuffer1\.n\)", line)
+        if count:
+            return f"{len(self._buffers.get(count.group(1), []))}\n"
+        buffer = re.fullmatch(r"printbuffer\(1, (\w+)\.nvbuffer1\.n, \w+\.nvbuffer1\.readings\)", line)
+        if buffer:
+            return ", ".join(f"{v:.9e}" for v in self._buffers.get(buffer.group(1), [])) + "\n"
+        raise ValueError(f"Simulated Keithley cannot answer: {line}")
+
+    def close(self) -> None:
+        self._abort_pulses()
+
+    def _assign(self, assignments: list[tuple[str, str, str]]) -> None:
+        # вся строка - одна команда прибора, задержка уже учтена в write
+        for smu, attr, expr in assignments:
+            sim_smu: SimSmu = getattr(self.k, smu)
+            value = getattr(SimSmu, expr.split(".", 1)[1]) if expr.startswith("smu") else float(expr)
+            channel = sim_smu.channel
+            with channel.lock:
+                setattr(channel, attr, float(value) if attr in ("levelv", "limiti") else int(value))
+                channel.changed()
+
+    def _start_pulses(self, script: list[str]) -> None:
+        """Запустить серию TspPulseScript в фоне, как trigger model прибора."""
+        self._abort_pulses()
+        text = "\n".join(script)
+        smu = re.search(r"(\w+)\.trigger\.source\.listv", text).group(1)  # type: ignore[union-attr]
+        level = float(re.search(r"listv\(\{([-\d.e+]+)\}\)", text).group(1))  # type: ignore[union-attr]
+        period = float(re.search(r"timer\[1\]\.delay = ([-\d.e+]+)", text).group(1))  # type: ignore[union-attr]
+        width = float(re.search(r"timer\[2\]\.delay = ([-\d.e+]+)", text).group(1))  # type: ignore[union-attr]
+        count = int(re.search(r"\w+\.trigger\.count = (\d+)", text).group(1))  # type: ignore[union-attr]
+        window = SIM_PULSE_WINDOW if "FILL_WINDOW" in text else 0
+        self._buffers[smu] = []
+        self._pulses_done = 0
+        self._pulse_thread = threading.Thread(
+            target=self._pulse_train,
+            args=(getattr(self.k, smu).channel, self._buffers[smu], level, width, period, count, window),
+            name="sim_pulses",
+            daemon=True,
+        )
+        self._pulse_thread.start()
+
+    def _pulse_train(
+        self,
+        channel: _SimChannel,
+        readings: list[float],
+        level: float,
+        width: float,
+        period: float,
+        count: int,
+        window: int,
+    ) -> None:
+        scale = self.k.settings.time_scale
+        with channel.lock:
+            channel.output = 1
+        started = time.monotonic()
+        index = 0
+        while count == 0 or index < count:
+            wait = started + index * period * scale - time.monotonic()
+            if self._pulse_abort.wait(max(wait, 0.0)):
+                break
+            with channel.lock:
+                channel.levelv = level
+                channel.changed()
+            aborted = self._pulse_abort.wait(width * scale)
+            if not aborted:
+                readings.append(channel.current())
+                self._pulses_done += 1
+                if window and len(readings) > window:
+                    del readings[0]
+            with channel.lock:
+                channel.levelv = 0.0
+                channel.changed()
+            if aborted:
+                break
+            index += 1
+
+    def _abort_pulses(self) -> None:
+        if self._pulse_thread is None:
+            return
+        self._pulse_abort.set()
+        self._pulse_thread.join()
+        self._pulse_thread = None
+        self._pulse_abort.clear()
+
+    def _run_sweep(self, script: list[str]) -> None:
+        """Выполнить скрипт TspSweepScript: уставки, задержка и число отсчетов."""
+        text = "\n".join(script)
+        smu = re.search(r"(\w+)\.source\.levelv", text).group(1)  # type: ignore[union-attr]
+        n = int(re.search(r"local n = (\d+)", text).group(1))  # type: ignore[union-attr]
+        count = int(re.search(r"measure\.count = (\d+)", text).group(1))  # type: ignore[union-attr]
+        formula = re.search(r"return ([-\d.e+]+) \+ \(i - 1\) \* ([-\d.e+]+) end", text)
+        if formula:
+            start, step = float(formula.group(1)), float(formula.group(2))
+            levels = [start + i * step for i in range(n)]
+        else:
+            levels = [float(v) for chunk in re.findall(r"ipairs\(\{(.*?)\}\)", text) for v in chunk.split(",")]
+        delay = re.search(r"delay\(([-\d.e+]+)\)", text)
+        delay_s = float(delay.group(1)) * self.k.settings.time_scale if delay else 0.0
+        channel: _SimChannel = getattr(self.k, smu).channel
+        readings: list[float] = []
+        for level in levels:
+            with channel.lock:
+                channel.levelv = level
+                channel.changed()
+            if delay_s > 0:
+                time.sleep(delay_s)
+            readings.extend(channel.current() for _ in range(count))
+        self._buffers[smu] = readings
+
+
+class SimulatedKeithley2600:
+    """Замена keithley2600.Keithley2600 для работы без прибора."""
+
+    def __init__(
+        self, resource: str = f"{SIM_RESOURCE_PREFIX}2611B", settings: SimKeithleySettings | None = None
+    ) -> None:
+        self.visa_address = resource
+        self.settings = settings or SimKeithleySettings.from_resource(resource)
+        rng = random.Random(self.settings.seed)
+        self.smua = SimSmu(_SimChannel(self.settings, rng), self._latency)
+        self.smub = SimSmu(_SimChannel(self.settings, rng), self._latency)
+        self.connection = SimConnection(self)
+        self.connected = True
+        self.commands = 0
+
+    def _latency(self) -> None:
+        self.commands += 1
+        if self.settings.latency_s > 0:
+            time.sleep(self.settings.latency_s)
+
+    def disconnect(self) -> None:
+        self.connected = False
+
+
+def is_sim_resource(resource: str | None) -> bool:
+    return bool(resource) and resource.upper().startswith(SIM_RESOURCE_PREFIX)  # type: ignore[union-attr]
+
+
+def open_keithley(resource: str) -> Any:
+    """Открыть прибор по строке ресурса: SIM::... - симулятор, иначе keithley2600."""
+    if is_sim_resource(resource):
+        return SimulatedKeithley2600(resource)
+    from keithley2600 import Keithley2600
+
+    return Keithley2600(resource)
@@ -0,0 +1,133 @@
+"""
+Компиляция и запуск sweep-скриптов TSP на Keithley 2600.
+
+Вместо обмена по одной точке (levelv -> measure.i) вся развертка
+загружается в прибор одним скриптом, прибор сам проходит уставки и
+складывает токи в smua.nvbuffer1, а хост забирает их одним чтением.
+"""
+from typing import Any, Sequence
+
+import numpy as np
+
+TSP_LEVELS_PER_LINE = 32
+TSP_SCRIPT_NAME = "kc_sweep"
+
+
+class TspSweepScript:
+    """Генератор текста TSP-скрипта развертки."""
+
+    def __init__(self, smu: str = "smua", name: str | None = None) -> None:
+        self.smu = smu
+        # имя скрипта в приборе глобальное: у каждого SMU свое, иначе движок
+        # другого канала перезапишет kc_sweep, а этот вызовет чужую развертку
+        self.name = name if name is not None else f"{TSP_SCRIPT_NAME}_{smu}"
+
+    def compile(self, levels: Sequence[float], delay_s: float, count: int = 1) -> list[str]:
+        """Собрать строки loadscript ... endscript для списка уставок.
+
+        Равномерная сетка (linspace) сворачивается в формулу, произвольный
+        список передается таблицей по TSP_LEVELS_PER_LINE значений в строке.
+        count - число отсчетов тока на уставку (smu.measure.count).
+        """
+        arr = np.asarray(levels, dtype=np.float64)
+        if arr.size == 0:
+            raise ValueError("TSP sweep requires at least one setpoint")
+        smu = self.smu
+        lines = [
+            f"loadscript {self.name}",
+            f"{smu}.nvbuffer1.clear()",
+            f"{smu}.nvbuffer1.appendmode = 1",
+            f"{smu}.measure.count = {max(1, int(count))}",
+            f"local n = {arr.size}",
+        ]
+        if self._is_uniform(arr):
+            step = float(arr[1] - arr[0]) if arr.size > 1 else 0.0
+            lines.append(f"local function level(i) return {arr[0]:.9g} + (i - 1) * {step:.9g} end")
+        else:
+            lines.append("local lv = {}")
+            for start in range(0, arr.size, TSP_LEVELS_PER_LINE):
+                chunk = ", ".join(f"{v:.9g}" for v in arr[start : start + TSP_LEVELS_PER_LINE])
+                lines.append(f"for _, v in ipairs({{{chunk}}}) do lv[#lv + 1] = v end")
+            lines.append("local function level(i) return lv[i] end")
+        lines.extend(
+            [
+                # measure.count возвращается в 1 и при ошибке развертки, иначе
+                # каждый следующий measure.i() хоста снимал бы count отсчетов
+                "local ok, err = pcall(function()",
+                "for i = 1, n do",
+                f"  {smu}.source.levelv = level(i)",
+                f"  delay({max(float(delay_s), 0.0):.9g})" if delay_s > 0 else "",
+                f"  {smu}.measure.i({smu}.nvbuffer1)",
+                "end",
+                "end)",
+                self.reset_line(),
+                "if not ok then error(err) end",
+                "endscript",
+            ]
+        )
+        return [line for line in lines if line]
+
+    def reset_line(self) -> str:
+        return f"{self.smu}.measure.count = 1"
+
+    def fetch_expr(self) -> str:
+        smu = self.smu
+        return f"printbuffer(1, {smu}.nvbuffer1.n, {smu}.nvbuffer1.readings)"
+
+    @staticmethod
+    def _is_uniform(arr: np.ndarray) -> bool:
+        if arr.size < 3:
+            return True
+        diff = np.diff(arr)
+        return bool(np.allclose(diff, diff[0], rtol=1e-9, atol=1e-12))
+
+
+class TspSweepEngine:
+    """Выполняет развертку на приборе и возвращает токи одним массивом.
+
+    Работает поверх VISA-сессии keithley2600 (атрибут connection),
+    вызывается синхронно (из asyncio.to_thread).
+    """
+
+    def __init__(self, k: Any, smu: str = "smua", timeout_margin_s: float = 5.0) -> None:
+        self.k = k
+        self.script = TspSweepScript(smu=smu)
+        self.timeout_margin_s = timeout_margin_s
+        self._loaded: list[str] | None = None
+
+    def run(self, levels: Sequence[float], delay_s: float, count: int = 1) -> list[float]:
+        """Выполнить развертку; возвращает len(levels) * count отсчетов подряд."""
+        conn = self.k.connection
+        lines = self.script.compile(levels, delay_s, count)
+        # в loop-режиме тот же скрипт не перезагружается каждый цикл
+        if lines != self._loaded:
+            for line in lines:
+                conn.write(line)
+            self._loaded = lines
+        # прибор отвечает на printbuffer только после окончания скрипта,
+        # поэтому таймаут чтения растягивается на ожидаемую длительность
+        expected_s = len(levels) * (max(float(delay_s), 0.0) + 0.02 * max(1, int(count)))
+        old_timeout = conn.timeout
+        conn.timeout = int((expected_s + self.timeout_margin_s) * 1000)
+        try:
+            conn.write(f"{self.script.name}()")
+            raw = conn.query(self.script.fetch_expr())
+        except Exception:
+            # скрипт мог не дойти до своего сброса (таймаут, обрыв) - сбрасываем с хоста
+            try:
+                conn.write(self.script.reset_line())
+            except Exception:
+                pass
+            raise
+        finally:
+            conn.timeout = old_timeout
+        values = self._parse_readings(raw)
+        if len(values) != len(levels) * max(1, int(count)):
+            raise RuntimeError(
+                f"TSP sweep returned {len(values)} readings, expected {len(levels) * max(1, int(count))}"
+            )
+        return values
+
+    @staticmethod
+    def _parse_readings(raw: str) -> list[float]:
+        return [float(item) for item in raw.replace("\n", ",").split(",") if item.strip()]
@@ -8,7 +8,6 @@ from loguru import logger
 from datetime import datetime
 import sys
 import re
-from PyQt6.QtCore import Qt, QTimer, QThread
 from pathlib import Path
 
 # from logger import logging
@@ -18,6 +17,17 @@ _initialized = False
 LOG_ENABLED = True           # General loguru logging
 SERIAL_LOG_ENABLED = True    # TX/RX serial hex stream logging (log_s)
 
+def ensure_level(name: str, color: str):
+    """Вернуть уровень loguru name (no=0), зарегистрировав его при первом вызове.
+
+    Уровень может быть уже создан другим модулем (эмулятор МПП) до log_init.
+    """
+    try:
+        return logger.level(name)
+    except ValueError:
+        return logger.level(name, no=0, color=color, icon="")
+
+
 def log_init():
     """Инициализировать loguru один раз и вернуть общий logger.
 
@@ -34,9 +44,9 @@ def log_init():
     except Exception:
         pass
 
-    rx_level= logger.level("RX", no=0, color="<red>", icon="")
-    tx_level= logger.level("TX", no=0, color="<green>", icon="")
-    emulator_level = logger.level("EMULATOR", no=0, color="<y>", icon="")
+    rx_level= ensure_level("RX", "<red>")
+    tx_level= ensure_level("TX", "<green>")
+    emulator_level = ensure_level("EMULATOR", "<y>")
 
     time_now = datetime.now()
     form_time = time_now.strftime("%Y-%m-%d %H_%M_%S")
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Эмулятор МПП на pymodbus для отладки и бенчмарков без железа.
+
+Сервер Modbus RTU слушает socket://host:port, такой адрес можно указать
+вместо COM-порта в ModBusSettings.com. Реализована карта MPP_REG:
+пики ACQ1_PEAK/ACQ2_PEAK (пиковый детектор, сбрасывается командой
+START_MEASURE_FORCED своего канала) зависят от входного напряжения, команды CMD_REG,
+осциллограммы OSCILL_CH0/CH1, гистограммы HIST_32/HIST_16 и TMP_COUNT.
+
+Сервер работает в своем потоке со своим event loop, задержка устройства
+и время передачи байтов RTU на заданной скорости эмулируются блокирующей
+паузой, как у настоящего полудуплексного устройства.
+"""
+import argparse
+import asyncio
+import math
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+from loguru import logger
+from pymodbus import Framer
+from pymodbus.datastore import ModbusSequentialDataBlock, ModbusServerContext, ModbusSlaveContext
+from pymodbus.server import ModbusSerialServer
+
+try:
+    from .device_registers import DeviceProtocol, MPP_CMD_REG, MPP_REG
+    from .log_config import ensure_level
+except Exception:
+    from src.device_registers import DeviceProtocol, MPP_CMD_REG, MPP_REG
+    from src.log_config import ensure_level
+
+EMULATOR_LEVEL = "EMULATOR"
+ADC_MAX = 0x0FFF
+OSCILL_POINTS = 256
+HIST_BINS = 6
+# стартовый бит + 8 бит данных + стоповый бит (8N1)
+RTU_CHAR_BITS = 10
+# пауза между кадрами RTU - 3.5 символа
+RTU_FRAME_GAP_CHARS = 3.5
+
+
+@dataclass
+class MppEmulatorSettings:
+    """Модель МПП: пересчет входного напряжения в коды АЦП и тайминги обмена."""
+
+    # код АЦП на 1 В входного напряжения, канал 2 грубее в ch2_ratio раз
+    gain_counts_per_v: float = 1000.0
+    ch2_ratio: float = 0.25
+    offset_counts: float = 20.0
+    noise_counts: float = 2.0
+    # длительность импульса в отсчетах осциллограммы
+    pulse_rise: float = 8.0
+    pulse_decay: float = 40.0
+    pulse_start: int = 32
+    # обработка запроса устройством и скорость линии для времени передачи
+    latency_s: float = 0.0
+    baudrate: int | None = None
+    seed: int | None = None
+
+
+class MppDataBlock(ModbusSequentialDataBlock):
+    """Регистры МПП с логикой команд и эмуляцией задержки обмена."""
+
+    def __init__(
+        self,
+        settings: MppEmulatorSettings,
+        input_voltage: Callable[[], float],
+    ) -> None:
+        super().__init__(0, [0] * (int(MPP_REG.OSCILL_CH1) + OSCILL_POINTS))
+        # уровень регистрируется здесь, а не при импорте: log_init может идти до или после
+        ensure_level(EMULATOR_LEVEL, "<y>")
+        self.settings = settings
+        self.input_voltage = input_voltage
+        self._rng = random.Random(settings.seed)
+        self._lock = threading.Lock()
+        self.measuring = False
+        self.transactions = 0
+
+    def getValues(self, address, count=1):
+        # PDU запроса чтения 8 байт, ответ - адрес, код, счетчик, данные, CRC
+        self._line_delay(8, 5 + 2 * count)
+        with self._lock:
+            if address <= int(MPP_REG.ACQ2_PEAK) and address + count > int(MPP_REG.ACQ1_PEAK):
+                self._hold_peaks()
+            values = super().getValues(address, count)
+        logger.log(EMULATOR_LEVEL, f"read {address:#06x} x{count}")
+        return values
+
+    def setValues(self, address, values):
+        values = [int(v) for v in (values if isinstance(values, list) else [values])]
+        self._line_delay(9 + 2 * len(values), 8)
+        with self._lock:
+            super().setValues(address, values)
+            if address == int(MPP_REG.CMD_REG):
+                self._execute(values)
+        logger.log(EMULATOR_LEVEL, f"write {address:#06x} {values}")
+
+    def peak(self, channel: int) -> int:
+        """Код пика канала (0 или 1) при текущем входном напряжении."""
+        gain = self.settings.gain_counts_per_v
+        if channel == 1:
+            gain *= self.settings.ch2_ratio
+        value = self.settings.offset_counts + gain * max(self.input_voltage(), 0.0)
+        value += self._rng.gauss(0.0, self.settings.noise_counts)
+        return int(min(max(round(value), 0), ADC_MAX))
+
+    def _line_delay(self, request_bytes: int, response_bytes: int) -> None:
+        self.transactions += 1
+        delay = self.settings.latency_s
+        if self.settings.baudrate:
+            chars = request_bytes + response_bytes + 2 * RTU_FRAME_GAP_CHARS
+            delay += chars * RTU_CHAR_BITS / self.settings.baudrate
+        if delay > 0:
+            time.sleep(delay)
+
+    def _execute(self, values: list[int]) -> None:
+        cmd, args = values[0], values[1:]
+        if cmd == MPP_CMD_REG.START_MEASURE_FORCED:
+            channel = args[0] if args else 0
+            self._trigger(channel)
+        elif cmd == MPP_CMD_REG.START_MEASURE:
+            self.measuring = bool(args and args[0])
+        elif cmd == MPP_CMD_REG.SET_LEVEL and args:
+            super().setValues(int(MPP_REG.LEVEL), [args[0]])
+        elif cmd == MPP_CMD_REG.WAVEFORM_RELEASE:
+            self._release_waveform()
+        elif cmd == MPP_CMD_REG.TRIG_COUNT_CLEAR:
+            super().setValues(int(MPP_REG.TMP_COUNT), [0])
+        elif cmd not in (MPP_CMD_REG.SET_HH, MPP_CMD_REG.FILTER_BYPASS):
+            logger.log(EMULATOR_LEVEL, f"unknown command {cmd:#06x}")
+
+    def _hold_peaks(self) -> None:
+        # после запуска измерения регистр держит максимум входа с момента запуска
+        held = super().getValues(int(MPP_REG.ACQ1_PEAK), 2)
+        peaks = [max(held[0], self.peak(0)), max(held[1], self.peak(1))]
+        super().setValues(int(MPP_REG.ACQ1_PEAK), peaks)
+
+    def _trigger(self, channel: int) -> None:
+        # пиковый детектор сбрасывается только у запущенного канала
+        index = 1 if channel else 0
+        peaks = list(super().getValues(int(MPP_REG.ACQ1_PEAK), 2))
+        peaks[index] = self.peak(index)
+        super().setValues(int(MPP_REG.ACQ1_PEAK), peaks)
+        count = super().getValues(int(MPP_REG.TMP_COUNT), 1)[0]
+        super().setValues(int(MPP_REG.TMP_COUNT), [(count + 1) & 0xFFFF])
+        self._fill_histograms(peaks[index])
+
+    def _fill_histograms(self, peak: int) -> None:
+        bin_index = min(peak * HIST_BINS // (ADC_MAX + 1), HIST_BINS - 1)
+        # HIST_32: 6 бинов по 32 бита (старшее слово первым), HIST_16: 6 бинов по 16 бит
+        addr32 = int(MPP_REG.HIST_32) + 2 * bin_index
+        hi, lo = super().getValues(addr32, 2)
+        value = ((hi << 16) | lo) + 1
+        super().setValues(addr32, [(value >> 16) & 0xFFFF, value & 0xFFFF])
+        addr16 = int(MPP_REG.HIST_16) + bin_index
+        super().setValues(addr16, [(super().getValues(addr16, 1)[0] + 1) & 0xFFFF])
+
+    def _release_waveform(self) -> None:
+        s = self.settings
+        shape = [
+            (1.0 - math.exp(-t / s.pulse_rise)) * math.exp(-t / s.pulse_decay) if t > 0 else 0.0
+            for t in (i - s.pulse_start for i in range(OSCILL_POINTS))
+        ]
+        # форма нормируется на максимум, чтобы вершина совпадала с пиком ACQ
+        top = max(shape) or 1.0
+        for reg, channel in ((MPP_REG.OSCILL_CH0, 0), (MPP_REG.OSCILL_CH1, 1)):
+            amplitude = self.peak(channel) - s.offset_counts
+            wave = []
+            for x in shape:
+                value = s.offset_counts + amplitude * x / top + self._rng.gauss(0.0, s.noise_counts)
+                wave.append(int(min(max(round(value), 0), ADC_MAX)))
+            super().setValues(int(reg), wave)
+
+
+class MppEmulator:
+    """Сервер эмулятора МПП в фоновом потоке.
+
+    input_voltage_v задает входное напряжение вручную, либо input_source
+    берет его из внешнего источника (например, симулятора Keithley).
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 5020,
+        slave_ids: tuple[int, ...] = (DeviceProtocol.MPP_ID_DEFAULT,),
+        settings: MppEmulatorSettings | None = None,
+        input_source: Callable[[], float] | None = None,
+    ) -> None:
+        self.host = host
+        self.port = int(port)
+        self.settings = settings or MppEmulatorSettings()
+        self.input_voltage_v = 0.0
+        self.input_source = input_source
+        self.blocks = {
+            int(slave): MppDataBlock(self.settings, self._input_voltage) for slave in slave_ids
+        }
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._server: ModbusSerialServer | None = None
+        self._thread: threading.Thread | None = None
+        self._ready = threading.Event()
+        self._error: BaseException | None = None
+
+    @property
+    def url(self) -> str:
+        """Адрес для AsyncModbusSerialClient(port=...)."""
+        return f"socket://{self.host}:{self.port}"
+
+    @property
+    def transactions(self) -> int:
+        return sum(block.transactions for block in self.blocks.values())
+
+    def start(self, timeout_s: float = 5.0) -> "MppEmulator":
+        self._thread = threading.Thread(target=self._run, name="mpp_emulator", daemon=True)
+        self._thread.start()
+        if not self._ready.wait(timeout_s):
+            raise TimeoutError("MPP emulator did not start")
+        if self._error is not None:
+            raise RuntimeError(f"MPP emulator failed: {self._error}")
+        logger.log(EMULATOR_LEVEL, f"MPP emulator listening on {self.url}, slaves {list(self.blocks)}")
+        return self
+
+    def stop(self) -> None:
+        if self._loop is not None and self._server is not None:
+            asyncio.run_coroutine_threadsafe(self._server.shutdown(), self._loop)
+        if self._thread is not None:
+            self._thread.join(timeout=5.0)
+            self._thread = None
+
+    def __enter__(self) -> "MppEmulator":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _input_voltage(self) -> float:
+        if self.input_source is not None:
+            return float(self.input_source())
+        return self.input_voltage_v
+
+    def _run(self) -> None:
+        try:
+            asyncio.run(self._serve())
+        except BaseException as exc:
+            self._error = exc
+            self._ready.set()
+
+    async def _serve(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        slaves = {
+            slave: ModbusSlaveContext(hr=block, zero_mode=True) for slave, block in self.blocks.items()
+        }
+        self._server = ModbusSerialServer(
+            ModbusServerContext(slaves=slaves, single=False),
+            framer=Framer.RTU,
+            port=self.url,
+            baudrate=self.settings.baudrate or 115200,
+        )
+        if not await self._server.listen():
+            raise OSError(f"cannot listen on {self.url}")
+        self._ready.set()
+        await self._server.serving
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Эмулятор МПП (Modbus RTU через socket://)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5020)
+    parser.add_argument("--id", type=int, action="append", help="адрес МПП, можно несколько")
+    parser.add_argument("--voltage", type=float, default=0.0, help="входное напряжение, В")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="задержка обработки запроса")
+    parser.add_argument("--baud", type=int, help="скорость линии для времени передачи RTU")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    settings = MppEmulatorSettings(latency_s=args.latency_ms / 1e3, baudrate=args.baud, seed=args.seed)
+    emulator = MppEmulator(args.host, args.port, tuple(args.id or [DeviceProtocol.MPP_ID_DEFAULT]), settings)
+    emulator.input_voltage_v = args.voltage
+    with emulator:
+        try:
+            while True:
+                time.sleep(1.0)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
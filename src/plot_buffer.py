@@ -0,0 +1,79 @@
+"""
+Буфер точек для живого графика с ограниченной памятью.
+
+Последние capacity точек хранятся без прореживания в кольцевом буфере.
+Вытесняемые точки сворачиваются пачками по bucket штук в пару
+(минимум, максимум) и уходят в историю; когда история заполняется,
+соседние пары снова сливаются. Размер данных для отрисовки не зависит
+от длительности измерения.
+"""
+import numpy as np
+
+
+class DecimatingRingBuffer:
+    """Кольцевой буфер с min/max-прореживанием старых точек."""
+
+    def __init__(self, capacity: int = 2048, bucket: int = 32, history_points: int = 2048) -> None:
+        self.capacity = max(2, int(capacity))
+        self.bucket = max(2, min(int(bucket), self.capacity))
+        # история хранит пары min/max, поэтому размер четный и кратен 4 для слияния
+        self.history_points = max(4, int(history_points) // 4 * 4)
+        self._x = np.empty(self.capacity, dtype=np.float64)
+        self._y = np.empty(self.capacity, dtype=np.float64)
+        self._head = 0
+        self._count = 0
+        self._hx = np.empty(self.history_points, dtype=np.float64)
+        self._hy = np.empty(self.history_points, dtype=np.float64)
+        self._hcount = 0
+        self.total = 0
+
+    def __len__(self) -> int:
+        return self._hcount + self._count
+
+    def append(self, x: float, y: float) -> None:
+        if self._count == self.capacity:
+            self._evict_bucket()
+        tail = (self._head + self._count) % self.capacity
+        self._x[tail] = x
+        self._y[tail] = y
+        self._count += 1
+        self.total += 1
+
+    def arrays(self) -> tuple[np.ndarray, np.ndarray]:
+        """Точки истории и свежие точки в порядке поступления."""
+        index = (self._head + np.arange(self._count)) % self.capacity
+        x = np.concatenate((self._hx[: self._hcount], self._x[index]))
+        y = np.concatenate((self._hy[: self._hcount], self._y[index]))
+        return x, y
+
+    def _evict_bucket(self) -> None:
+        index = (self._head + np.arange(self.bucket)) % self.capacity
+        bx, by = self._x[index], self._y[index]
+        pair = np.sort(np.array([int(np.argmin(by)), int(np.argmax(by))]))
+        if self._hcount + 2 > self.history_points:
+            self._compact_history()
+        self._hx[self._hcount : self._hcount + 2] = bx[pair]
+        self._hy[self._hcount : self._hcount + 2] = by[pair]
+        self._hcount += 2
+        self._head = (self._head + self.bucket) % self.capacity
+        self._count -= self.bucket
+
+    def _compact_history(self) -> None:
+        # две соседние пары min/max -> одна пара
+        n = self._hcount // 4 * 4
+        hx = self._hx[:n].reshape(-1, 4)
+        hy = self._hy[:n].reshape(-1, 4)
+        rows = np.arange(hy.shape[0])
+        lo = np.argmin(hy, axis=1)
+        hi = np.argmax(hy, axis=1)
+        first = np.minimum(lo, hi)
+        second = np.maximum(lo, hi)
+        merged_x = np.column_stack((hx[rows, first], hx[rows, second])).ravel()
+        merged_y = np.column_stack((hy[rows, first], hy[rows, second])).ravel()
+        size = merged_x.size
+        self._hx[:size] = merged_x
+        self._hy[:size] = merged_y
+        rest = self._hcount - n
+        self._hx[size : size + rest] = self._hx[n : self._hcount]
+        self._hy[size : size + rest] = self._hy[n : self._hcount]
+        self._hcount = size + rest
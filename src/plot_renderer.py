@@ -64,6 +64,21 @@ class GraphPen():
             print(f"Ошибка отрисовки: {e}")
             return [],[]
 
+    async def draw_averaged(self, y: np.ndarray, baseline: float, position: int, amplitude: float) -> None:
+        """Усредненная осциллограмма с базовой линией и отметкой пика"""
+        try:
+            self.plt_widget.clear()
+            self.plot_item = pg.PlotDataItem(np.arange(y.size), y, pen=self.pen)
+            self.plt_widget.addItem(self.plot_item)
+            self.plt_widget.addItem(
+                pg.InfiniteLine(pos=baseline, angle=0, pen=pg.mkPen((150, 150, 150), style=QtCore.Qt.PenStyle.DashLine))
+            )
+            self.plt_widget.addItem(
+                pg.ScatterPlotItem([position], [baseline + amplitude], symbol="x", size=12, pen=pg.mkPen((255, 60, 60)))
+            )
+        except Exception as e:
+            print(f"Ошибка отрисовки: {e}")
+
     async def _prepare_graph_data(self, data):
         """Подготовка данных для графика"""
         x, y = [], []
@@ -0,0 +1,161 @@
+"""
+Конвейер импульсы -> чтение осциллограмм МПП -> отрисовка.
+
+Стадии работают в отдельных задачах и связаны ограниченными очередями,
+поэтому частоту импульсов не ограничивают Modbus-чтение и отрисовка.
+Если чтение не успевает, очередь перед ним ведет себя по политике:
+drop_oldest - выбросить самое старое событие, skip - не ставить новое,
+throttle - ждать места (генератор импульсов тормозится).
+"""
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Literal
+
+OverflowPolicy = Literal["drop_oldest", "skip", "throttle"]
+OVERFLOW_POLICIES: tuple[OverflowPolicy, ...] = ("drop_oldest", "skip", "throttle")
+
+_END = object()
+
+
+@dataclass(frozen=True)
+class PulseEvent:
+    """Импульсы, выполненные к моменту опроса: index - их число."""
+
+    index: int
+    timestamp: float = field(default_factory=time.monotonic)
+
+
+class StageQueue:
+    """Ограниченная очередь между стадиями с политикой переполнения."""
+
+    def __init__(self, maxsize: int, policy: OverflowPolicy = "drop_oldest") -> None:
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {policy}")
+        self.maxsize = max(1, int(maxsize))
+        self.policy = policy
+        self._queue: asyncio.Queue[Any] = asyncio.Queue(self.maxsize)
+        self.dropped = 0
+        self.max_depth = 0
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    async def put(self, item: Any) -> bool:
+        """Поставить элемент; False - элемент не поставлен (политика skip)."""
+        if self.policy == "throttle":
+            await self._queue.put(item)
+        else:
+            if self._queue.full():
+                if self.policy == "skip":
+                    self.dropped += 1
+                    return False
+                self._queue.get_nowait()
+                self.dropped += 1
+            self._queue.put_nowait(item)
+        self.max_depth = max(self.max_depth, self._queue.qsize())
+        return True
+
+    async def get(self) -> Any:
+        return await self._queue.get()
+
+    async def close(self) -> None:
+        # признак конца не должен потеряться: при нужде вытесняет самый старый элемент
+        if self.policy != "throttle" and self._queue.full():
+            self._queue.get_nowait()
+            self.dropped += 1
+        await self._queue.put(_END)
+
+
+class PulsePipeline:
+    """Три стадии: события импульсов, чтение данных по событию, отрисовка.
+
+    fetch возвращает данные осциллограммы или None (нечего рисовать);
+    on_update вызывается после каждого шага со stats() для индикации.
+    Очередь отрисовки при любой политике, кроме throttle, держит только
+    самые свежие кадры.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[PulseEvent], Awaitable[Any]],
+        render: Callable[[PulseEvent, Any], Awaitable[None]],
+        policy: OverflowPolicy = "drop_oldest",
+        fetch_depth: int = 4,
+        render_depth: int = 2,
+        on_update: Callable[[dict[str, int]], None] | None = None,
+    ) -> None:
+        self.fetch = fetch
+        self.render = render
+        self.on_update = on_update
+        self.fetch_queue = StageQueue(fetch_depth, policy)
+        self.render_queue = StageQueue(render_depth, "throttle" if policy == "throttle" else "drop_oldest")
+        self.produced = 0
+        self.fetched = 0
+        self.rendered = 0
+
+    async def run(self, events: AsyncIterator[PulseEvent]) -> None:
+        tasks = [
+            asyncio.create_task(self._produce(events)),
+            asyncio.create_task(self._fetch_loop()),
+            asyncio.create_task(self._render_loop()),
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "produced": self.produced,
+            "fetched": self.fetched,
+            "rendered": self.rendered,
+            "fetch_depth": self.fetch_queue.depth,
+            "fetch_max": self.fetch_queue.maxsize,
+            "render_depth": self.render_queue.depth,
+            "render_max": self.render_queue.maxsize,
+            "dropped": self.fetch_queue.dropped + self.render_queue.dropped,
+        }
+
+    def summary(self) -> str:
+        s = self.stats()
+        return (
+            f"events {s['produced']}, fetched {s['fetched']}, rendered {s['rendered']}, dropped {s['dropped']}, "
+            f"max depth fetch {self.fetch_queue.max_depth}/{s['fetch_max']} "
+            f"render {self.render_queue.max_depth}/{s['render_max']}"
+        )
+
+    async def _produce(self, events: AsyncIterator[PulseEvent]) -> None:
+        async for event in events:
+            self.produced += 1
+            await self.fetch_queue.put(event)
+            self._notify()
+        await self.fetch_queue.close()
+
+    async def _fetch_loop(self) -> None:
+        while True:
+            event = await self.fetch_queue.get()
+            if event is _END:
+                await self.render_queue.close()
+                return
+            data = await self.fetch(event)
+            self.fetched += 1
+            if data is not None:
+                await self.render_queue.put((event, data))
+            self._notify()
+
+    async def _render_loop(self) -> None:
+        while True:
+            item = await self.render_queue.get()
+            if item is _END:
+                return
+            await self.render(*item)
+            self.rendered += 1
+            self._notify()
+
+    def _notify(self) -> None:
+        if self.on_update is not None:
+            self.on_update(self.stats())
@@ -0,0 +1,251 @@
+"""
+Буферизированная запись результатов измерений.
+
+Строки копятся в памяти и сбрасываются в файл пачкой по порогу размера
+или времени. После каждой пачки в журнал (<file>.journal) дописывается
+число строк и смещение конца файла, поэтому после аварии файл
+восстанавливается до последней целой пачки.
+"""
+import csv
+import io
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Sequence
+
+from loguru import logger
+
+JOURNAL_SUFFIX = ".journal"
+JOURNAL_COMPACT_BYTES = 4096
+
+
+@dataclass(frozen=True)
+class ResultColumn:
+    """Описание колонки результата: имя, тип numpy и формат для текста."""
+
+    name: str
+    dtype: str = "object"
+    fmt: str | None = None
+
+    def format(self, value: Any) -> str:
+        if value is None:
+            return ""
+        if self.fmt is not None:
+            return format(value, self.fmt)
+        return str(value)
+
+
+class BufferedResultWriter:
+    """CSV-писатель с пакетным сбросом, журналом и ротацией файлов."""
+
+    def __init__(
+        self,
+        path: Path,
+        columns: Sequence[ResultColumn],
+        batch_rows: int = 64,
+        flush_interval_s: float = 1.0,
+        rotate_rows: int | None = None,
+    ) -> None:
+        self.base_path = Path(path)
+        self.columns = list(columns)
+        self.batch_rows = max(1, int(batch_rows))
+        self.flush_interval_s = max(0.0, float(flush_interval_s))
+        self.rotate_rows = int(rotate_rows) if rotate_rows else None
+        self.paths: list[Path] = []
+        self.rows_total = 0
+        self._part = 0
+        self._file: io.TextIOWrapper | None = None
+        self._journal: io.TextIOWrapper | None = None
+        self._pending: list[list[str]] = []
+        self._rows_in_file = 0
+        self._committed_offset = 0
+        self._last_flush = time.monotonic()
+        self._started = time.monotonic()
+        self._bytes_total = 0
+        self._flush_count = 0
+        self._flush_time_s = 0.0
+
+    @property
+    def path(self) -> Path:
+        return self.paths[-1] if self.paths else self.base_path
+
+    @property
+    def journal_path(self) -> Path:
+        return self.path.with_name(self.path.name + JOURNAL_SUFFIX)
+
+    def open(self, append: bool = False, state: dict[str, Any] | None = None) -> "BufferedResultWriter":
+        """Открыть файл; append - дописывать, state - продолжить с сохраненного state()."""
+        self._started = time.monotonic()
+        self._last_flush = self._started
+        if state is not None:
+            self._restore(state)
+        else:
+            self._open_part(self.base_path, append)
+        return self
+
+    def state(self) -> dict[str, Any]:
+        """Позиция последней подтвержденной пачки для контрольной точки."""
+        return {"part": self._part, "rows": self._rows_in_file, "offset": self._committed_offset}
+
+    def write(self, row: Sequence[Any]) -> None:
+        self._pending.append([col.format(value) for col, value in zip(self.columns, row)])
+        if (
+            len(self._pending) >= self.batch_rows
+            or time.monotonic() - self._last_flush >= self.flush_interval_s
+        ):
+            self.flush()
+
+    def flush(self) -> None:
+        if self._file is None or not self._pending:
+            self._last_flush = time.monotonic()
+            return
+        t0 = time.perf_counter()
+        while self._pending:
+            take = len(self._pending)
+            if self.rotate_rows is not None:
+                take = min(take, self.rotate_rows - self._rows_in_file)
+            batch, self._pending = self._pending[:take], self._pending[take:]
+            self._commit(batch)
+            if self.rotate_rows is not None and self._rows_in_file >= self.rotate_rows:
+                self._rotate()
+        self._flush_time_s += time.perf_counter() - t0
+        self._flush_count += 1
+        self._last_flush = time.monotonic()
+
+    def close(self) -> None:
+        if self._file is None:
+            return
+        try:
+            self.flush()
+        finally:
+            self._close_part()
+            self._log_throughput()
+
+    def __enter__(self) -> "BufferedResultWriter":
+        return self.open()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def _commit(self, batch: list[list[str]]) -> None:
+        assert self._file is not None and self._journal is not None
+        buf = io.StringIO()
+        csv.writer(buf).writerows(batch)
+        data = buf.getvalue()
+        self._file.write(data)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._rows_in_file += len(batch)
+        self._committed_offset = self._file.tell()
+        self.rows_total += len(batch)
+        self._bytes_total += len(data.encode("utf-8"))
+        self._journal_append()
+
+    def _journal_append(self) -> None:
+        assert self._file is not None and self._journal is not None
+        self._journal.write(f"{self._rows_in_file} {self._file.tell()}\n")
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        if self._journal.tell() > JOURNAL_COMPACT_BYTES:
+            self._compact_journal()
+
+    def _compact_journal(self) -> None:
+        assert self._file is not None and self._journal is not None
+        self._journal.close()
+        tmp = self.journal_path.with_suffix(".tmp")
+        tmp.write_text(f"{self._rows_in_file} {self._file.tell()}\n", encoding="utf-8")
+        os.replace(tmp, self.journal_path)
+        self._journal = self.journal_path.open("a", encoding="utf-8")
+
+    def _open_part(self, path: Path, append: bool) -> None:
+        self.paths.append(path)
+        if append and path.exists():
+            self._rows_in_file = self.recover(path)
+            self._file = path.open("a", newline="", encoding="utf-8")
+        else:
+            self._rows_in_file = 0
+            self._file = path.open("w", newline="", encoding="utf-8")
+            csv.writer(self._file).writerow([col.name for col in self.columns])
+            self._file.flush()
+        self._committed_offset = self._file.tell()
+        self._journal = self.journal_path.open("a", encoding="utf-8")
+        self._journal_append()
+
+    def _close_part(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def _part_path(self, part: int) -> Path:
+        if part == 0:
+            return self.base_path
+        return self.base_path.with_name(f"{self.base_path.stem}_{part:03d}{self.base_path.suffix}")
+
+    def _rotate(self) -> None:
+        self._close_part()
+        self._part += 1
+        path = self._part_path(self._part)
+        logger.info(f"Result file rotated: {path}")
+        self._open_part(path, append=False)
+
+    def _restore(self, state: dict[str, Any]) -> None:
+        self._part = int(state.get("part", 0))
+        self.paths = [self._part_path(part) for part in range(self._part)]
+        path = self._part_path(self._part)
+        # части, начатые после контрольной точки, не подтверждены
+        stale_part = self._part + 1
+        while (stale := self._part_path(stale_part)).exists():
+            logger.warning(f"Removing result part written after checkpoint: {stale}")
+            stale.unlink()
+            stale.with_name(stale.name + JOURNAL_SUFFIX).unlink(missing_ok=True)
+            stale_part += 1
+        if not path.exists():
+            self._open_part(path, append=False)
+            return
+        offset = int(state.get("offset", path.stat().st_size))
+        if path.stat().st_size > offset:
+            logger.warning(f"Dropping rows of {path} written after checkpoint: {path.stat().st_size - offset} bytes")
+            with path.open("r+b") as fh:
+                fh.truncate(offset)
+        self.paths.append(path)
+        self._rows_in_file = int(state.get("rows", 0))
+        self._file = path.open("a", newline="", encoding="utf-8")
+        self._committed_offset = self._file.tell()
+        self.journal_path.unlink(missing_ok=True)
+        self._journal = self.journal_path.open("a", encoding="utf-8")
+        self._journal_append()
+
+    @staticmethod
+    def recover(path: Path) -> int:
+        """Обрезать файл до последней подтвержденной журналом пачки.
+
+        Возвращает число строк данных в файле.
+        """
+        journal = path.with_name(path.name + JOURNAL_SUFFIX)
+        if not journal.exists():
+            with path.open("r", newline="", encoding="utf-8") as fh:
+                return max(sum(1 for _ in fh) - 1, 0)
+        rows, offset = 0, None
+        for line in journal.read_text(encoding="utf-8").splitlines():
+            parts = line.split()
+            if len(parts) == 2:
+                rows, offset = int(parts[0]), int(parts[1])
+        if offset is not None and path.stat().st_size > offset:
+            logger.warning(f"Dropping unconfirmed tail of {path}: {path.stat().st_size - offset} bytes")
+            with path.open("r+b") as fh:
+                fh.truncate(offset)
+        return rows
+
+    def _log_throughput(self) -> None:
+        elapsed = max(time.monotonic() - self._started, 1e-9)
+        flush_ms = self._flush_time_s / self._flush_count * 1e3 if self._flush_count else 0.0
+        logger.info(
+            f"Result writer {self.base_path.name}: {self.rows_total} rows, "
+            f"{self._bytes_total / 1024:.1f} KiB in {elapsed:.1f} s "
+            f"({self.rows_total / elapsed:.1f} rows/s), "
+            f"{self._flush_count} flushes, {flush_ms:.2f} ms/flush"
+        )
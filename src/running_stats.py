@@ -0,0 +1,53 @@
+"""
+Потоковая статистика по отсчетам точки (алгоритм Уэлфорда).
+
+Память постоянная: среднее, M2, минимум, максимум и число отсчетов.
+"""
+import math
+from typing import Iterable
+
+
+class RunningStats:
+    """Накопитель среднего, дисперсии, минимума и максимума."""
+
+    __slots__ = ("count", "mean", "_m2", "min", "max")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    @classmethod
+    def of(cls, values: Iterable[float]) -> "RunningStats":
+        stats = cls()
+        for value in values:
+            stats.push(value)
+        return stats
+
+    def push(self, value: float) -> None:
+        value = float(value)
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    @property
+    def variance(self) -> float:
+        return self._m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.variance)
+
+    @property
+    def sem(self) -> float:
+        """Стандартная ошибка среднего; inf, пока отсчет один."""
+        if self.count < 2:
+            return math.inf
+        return self.std / math.sqrt(self.count)
@@ -0,0 +1,149 @@
+"""
+План уставок процесса измерения.
+
+Режим измерения один раз компилируется в массивы numpy: напряжения и
+паузы после установки уровня. Известный заранее план дает число точек
+и оценку длительности (ETA) до запуска, позволяет отдать развертку
+прибору целиком (TSP) и не держит длинные списки уставок в JSON -
+их можно читать из .npy или CSV.
+"""
+import math
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, Literal
+
+import numpy as np
+
+PlanOrder = Literal["forward", "reverse", "bidirectional", "random"]
+
+
+@dataclass(frozen=True)
+class SetpointPlan:
+    """Уставки (В) и паузы после установки уровня (с) одинаковой длины."""
+
+    voltages: np.ndarray
+    delays: np.ndarray
+
+    def __post_init__(self) -> None:
+        if self.voltages.shape != self.delays.shape or self.voltages.ndim != 1:
+            raise ValueError(f"Plan arrays mismatch: {self.voltages.shape} vs {self.delays.shape}")
+
+    @classmethod
+    def of(cls, voltages: np.ndarray | list, delay_s: float | np.ndarray) -> "SetpointPlan":
+        v = np.ascontiguousarray(voltages, dtype=np.float64).reshape(-1)
+        d = np.broadcast_to(np.asarray(delay_s, dtype=np.float64), v.shape).copy()
+        return cls(v, d)
+
+    def __len__(self) -> int:
+        return int(self.voltages.size)
+
+    def iter_from(self, start: int = 0) -> Iterator[tuple[float, float]]:
+        # tolist() разом переводит хвост плана в float без поштучного обращения к numpy
+        return zip(self.voltages[start:].tolist(), self.delays[start:].tolist())
+
+    @property
+    def uniform_delay(self) -> float | None:
+        """Общая пауза, если она одинакова для всех точек (нужно для TSP)."""
+        if not len(self):
+            return 0.0
+        first = float(self.delays[0])
+        return first if bool(np.all(self.delays == first)) else None
+
+    def duration_s(self, start: int = 0) -> float:
+        """Сумма пауз от точки start до конца плана."""
+        return float(self.delays[start:].sum())
+
+    def ordered(self, order: PlanOrder = "forward", repeats: int = 1, seed: int | None = None) -> "SetpointPlan":
+        """План в заданном порядке обхода, повторенный repeats раз подряд."""
+        index = np.arange(len(self))
+        if order == "reverse":
+            index = index[::-1]
+        elif order == "bidirectional":
+            # туда и обратно без повтора крайней точки
+            index = np.concatenate([index, index[-2::-1]]) if index.size > 1 else index
+        elif order == "random":
+            index = np.random.default_rng(seed).permutation(index)
+        elif order != "forward":
+            raise ValueError(f"Unknown plan order: {order}")
+        index = np.tile(index, max(1, int(repeats)))
+        return SetpointPlan(self.voltages[index], self.delays[index])
+
+
+def linear_plan(start: float, stop: float, points: int, delay_s: float) -> SetpointPlan:
+    return SetpointPlan.of(np.linspace(float(start), float(stop), max(1, int(points))), delay_s)
+
+
+def log_plan(start: float, stop: float, points: int, delay_s: float) -> SetpointPlan:
+    """Логарифмическая сетка; оба конца одного знака и не нули."""
+    if start == 0 or stop == 0 or (start > 0) != (stop > 0):
+        raise ValueError(f"Log sweep needs nonzero bounds of one sign: {start}..{stop}")
+    return SetpointPlan.of(np.geomspace(float(start), float(stop), max(1, int(points))), delay_s)
+
+
+def load_plan(path: str | Path, delay_s: float) -> SetpointPlan:
+    """Уставки из .npy или CSV.
+
+    Одна колонка (или одномерный .npy) - напряжения с паузой delay_s,
+    две колонки - напряжение и своя пауза точки. В CSV допускается строка
+    заголовка.
+    """
+    path = Path(path)
+    if path.suffix.lower() == ".npy":
+        data = np.load(path, mmap_mode="r")
+    else:
+        data = _load_csv(path)
+    data = np.asarray(data, dtype=np.float64)
+    if data.ndim == 1:
+        plan = SetpointPlan.of(data, delay_s)
+    elif data.ndim == 2 and data.shape[1] in (1, 2):
+        plan = SetpointPlan.of(data[:, 0], data[:, 1] if data.shape[1] == 2 else delay_s)
+    else:
+        raise ValueError(f"Setpoint file must have 1 or 2 columns: {path} {data.shape}")
+    if not len(plan):
+        raise ValueError(f"Setpoint file is empty: {path}")
+    if not (np.all(np.isfinite(plan.voltages)) and np.all(np.isfinite(plan.delays))):
+        raise ValueError(f"Setpoint file has non-finite values: {path}")
+    return plan
+
+
+def _load_csv(path: Path) -> np.ndarray:
+    with path.open("r", encoding="utf-8") as fh:
+        first = fh.readline()
+    delimiter = ";" if ";" in first else ","
+    try:
+        [float(item) for item in first.split(delimiter) if item.strip()]
+        skip = 0
+    except ValueError:
+        skip = 1
+    return np.loadtxt(path, delimiter=delimiter, skiprows=skip, ndmin=2)
+
+
+class PlanProgress:
+    """Прогресс по плану и ETA по наблюдаемой скорости точек, не чаще interval_s."""
+
+    def __init__(self, total: int, done: int = 0, interval_s: float = 10.0) -> None:
+        self.total = int(total)
+        self.interval_s = float(interval_s)
+        self._start_done = int(done)
+        self._started = time.monotonic()
+        self._last_report = self._started
+
+    def report(self, done: int) -> str | None:
+        now = time.monotonic()
+        if now - self._last_report < self.interval_s and done < self.total:
+            return None
+        self._last_report = now
+        measured = done - self._start_done
+        elapsed = now - self._started
+        eta = (self.total - done) * elapsed / measured if measured > 0 else math.nan
+        percent = 100.0 * done / self.total if self.total else 100.0
+        return f"{done}/{self.total} points ({percent:.1f}%), ETA {_fmt_s(eta)}"
+
+
+def _fmt_s(seconds: float) -> str:
+    if not math.isfinite(seconds):
+        return "n/a"
+    minutes, sec = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{sec:02d}"
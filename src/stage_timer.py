@@ -0,0 +1,99 @@
+"""
+Тайминги стадий точки измерения.
+
+PointTimer копит длительности стадий одной точки по perf_counter_ns
+(монотонные часы с наносекундным разрешением), StageHistograms собирает
+их в гистограммы с бинами по степеням двойки в микросекундах - память
+постоянная при любой длительности процесса.
+"""
+import contextlib
+import time
+from typing import Awaitable, Iterator, TypeVar
+
+T = TypeVar("T")
+
+STAGES = ("set_level", "settle", "modbus_cmd", "read", "persist", "plot")
+# бин i - длительности до 2**i мкс включительно, последний - все что больше
+HIST_BINS = 26
+
+
+class PointTimer:
+    """Длительности стадий одной точки в наносекундах."""
+
+    __slots__ = ("started_ns", "stages")
+
+    def __init__(self) -> None:
+        self.started_ns = time.perf_counter_ns()
+        self.stages = dict.fromkeys(STAGES, 0)
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        t0 = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.stages[name] += time.perf_counter_ns() - t0
+
+    async def timed(self, name: str, awaitable: Awaitable[T]) -> T:
+        """Дождаться awaitable, записав время в стадию (для asyncio.gather)."""
+        with self.stage(name):
+            return await awaitable
+
+    def micros(self, name: str) -> float:
+        return self.stages[name] / 1e3
+
+
+class StageHistograms:
+    """Гистограммы длительностей стадий по всем точкам процесса."""
+
+    def __init__(self) -> None:
+        self.bins = {name: [0] * (HIST_BINS + 1) for name in STAGES}
+        self.count = dict.fromkeys(STAGES, 0)
+        self.total_ns = dict.fromkeys(STAGES, 0)
+        self.max_ns = dict.fromkeys(STAGES, 0)
+
+    def add(self, timer: PointTimer) -> None:
+        for name, ns in timer.stages.items():
+            if ns <= 0:
+                continue
+            us = -(-ns // 1000)
+            self.bins[name][min((us - 1).bit_length(), HIST_BINS)] += 1
+            self.count[name] += 1
+            self.total_ns[name] += ns
+            self.max_ns[name] = max(self.max_ns[name], ns)
+
+    def quantile_us(self, name: str, q: float) -> float:
+        """Верхняя граница бина, в который попадает квантиль q."""
+        rank = q * self.count[name]
+        seen = 0
+        for index, hits in enumerate(self.bins[name]):
+            seen += hits
+            if hits and seen >= rank:
+                return min(float(2**index), self.max_ns[name] / 1e3)
+        return 0.0
+
+    def summary(self) -> list[str]:
+        lines = []
+        for name in STAGES:
+            count = self.count[name]
+            if not count:
+                continue
+            hist = " ".join(
+                f"<={_fmt_us(2**index) if index < HIST_BINS else 'inf'}:{hits}"
+                for index, hits in enumerate(self.bins[name])
+                if hits
+            )
+            lines.append(
+                f"{name}: n={count} mean {_fmt_us(self.total_ns[name] / count / 1e3)} "
+                f"p50<={_fmt_us(self.quantile_us(name, 0.5))} p95<={_fmt_us(self.quantile_us(name, 0.95))} "
+                f"max {_fmt_us(self.max_ns[name] / 1e3)} [{hist}]"
+            )
+        return lines
+
+
+def _fmt_us(us: float) -> str:
+    if us >= 1e6:
+        return f"{us / 1e6:.3g}s"
+    if us >= 1e3:
+        return f"{us / 1e3:.3g}ms"
+    return f"{us:.3g}us"
@@ -0,0 +1,134 @@
+"""
+Поиск VISA-прибора по ответу на *IDN?.
+
+Сначала опрашивается последний найденный ресурс из кэша на диске; если он
+не отвечает или отвечает не тем прибором, остальные ресурсы опрашиваются
+параллельно в пуле потоков с коротким таймаутом. Кэш хранит последний
+удачный ресурс и ответы *IDN? всех опрошенных ресурсов (IDN -> ресурс),
+так что полный перебор нужен только когда прибор переехал на другой порт.
+"""
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Callable
+
+DEFAULT_CACHE_PATH = Path().resolve() / ".visa_cache.json"
+PROBE_TIMEOUT_MS = 500
+PROBE_WORKERS = 8
+
+
+class DiscoveryCache:
+    """Кэш поиска: последний удачный ресурс и последние ответы *IDN? по ресурсам."""
+
+    def __init__(self, path: Path = DEFAULT_CACHE_PATH) -> None:
+        self.path = Path(path)
+        self.last: str | None = None
+        self.idn: dict[str, str] = {}
+        self._load()
+
+    def resource_for(self, match: Callable[[str], bool]) -> str | None:
+        """Последний удачный ресурс, иначе любой ресурс, чей IDN подходит."""
+        if self.last is not None and match(self.idn.get(self.last, "")):
+            return self.last
+        return next((res for res, idn in self.idn.items() if match(idn)), None)
+
+    def save(self) -> None:
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            tmp.write_text(json.dumps({"last": self.last, "idn": self.idn}, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, self.path)
+        except OSError:
+            # кэш - только ускорение, без него поиск работает полным перебором
+            pass
+
+    def _load(self) -> None:
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            self.last = data.get("last")
+            self.idn = {str(k): str(v) for k, v in (data.get("idn") or {}).items()}
+        except (OSError, ValueError, AttributeError):
+            self.last, self.idn = None, {}
+
+
+class VisaDiscovery:
+    """Поиск ресурса, чей ответ *IDN? удовлетворяет match.
+
+    find() возвращает (ресурс, IDN) или None. rm - pyvisa.ResourceManager,
+    создается один раз и переиспользуется между поисками.
+    """
+
+    def __init__(
+        self,
+        rm: Any,
+        match: Callable[[str], bool],
+        timeout_ms: int = PROBE_TIMEOUT_MS,
+        workers: int = PROBE_WORKERS,
+        cache: DiscoveryCache | None = None,
+    ) -> None:
+        self.rm = rm
+        self.match = match
+        self.timeout_ms = timeout_ms
+        self.workers = max(1, int(workers))
+        self.cache = cache if cache is not None else DiscoveryCache()
+
+    def find(self) -> tuple[str, str] | None:
+        cached = self.cache.resource_for(self.match)
+        if cached is not None:
+            idn = self.probe(cached)
+            if idn is not None and self.match(idn):
+                return self._remember(cached, idn)
+            self.cache.idn.pop(cached, None)
+        candidates = [res for res in self.rm.list_resources() if res != cached]
+        return self._scan(candidates)
+
+    def probe(self, res: str) -> str | None:
+        """Ответ ресурса на *IDN? или None, если он не открылся или не ответил."""
+        try:
+            inst = self.rm.open_resource(res, open_timeout=self.timeout_ms)
+        except Exception:
+            return None
+        try:
+            inst.timeout = self.timeout_ms
+            return inst.query("*IDN?").strip()
+        except Exception:
+            return None
+        finally:
+            try:
+                inst.close()
+            except Exception:
+                pass
+
+    def _scan(self, candidates: list[str]) -> tuple[str, str] | None:
+        if not candidates:
+            self.cache.save()
+            return None
+        found: tuple[str, str] | None = None
+        pool = ThreadPoolExecutor(max_workers=min(self.workers, len(candidates)), thread_name_prefix="visa_probe")
+        try:
+            pending: dict[Future, str] = {pool.submit(self.probe, res): res for res in candidates}
+            while pending and found is None:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    res = pending.pop(future)
+                    idn = future.result()
+                    if idn is None:
+                        self.cache.idn.pop(res, None)
+                        continue
+                    self.cache.idn[res] = idn
+                    if found is None and self.match(idn):
+                        found = (res, idn)
+        finally:
+            # еще не начатые опросы не нужны, начатые завершатся по таймауту
+            pool.shutdown(wait=False, cancel_futures=True)
+        if found is None:
+            self.cache.save()
+            return None
+        return self._remember(*found)
+
+    def _remember(self, res: str, idn: str) -> tuple[str, str]:
+        self.cache.last = res
+        self.cache.idn[res] = idn
+        self.cache.save()
+        return res, idn
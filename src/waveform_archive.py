@@ -0,0 +1,176 @@
+"""
+Архив осциллограмм МПП для серий импульсов.
+
+Файл .wfa - заголовок фиксированного размера и массив записей одной
+ширины: номер импульса, время захвата (Unix, с), число отсчетов и
+отсчеты uint16. Место под записи выделяется заранее и открывается
+через np.memmap, поэтому добавление записи - копирование отсчетов в
+уже отображенную память без выделений; при заполнении файл растет
+вдвое. Читатель дает произвольный доступ к любой записи по номеру.
+Число записей хранится в заголовке и обновляется при каждом добавлении,
+так что архив читается и во время записи, и после аварийного завершения.
+"""
+import time
+from pathlib import Path
+from typing import Sequence
+
+import numpy as np
+
+ARCHIVE_SUFFIX = ".wfa"
+ARCHIVE_MAGIC = b"KCWFA001"
+HEADER_SIZE = 64
+DEFAULT_WIDTH = 256
+DEFAULT_CAPACITY = 4096
+
+HEADER_DTYPE = np.dtype(
+    {
+        "names": ["magic", "width", "count"],
+        "formats": ["S8", "<u4", "<u8"],
+        "offsets": [0, 8, 16],
+        "itemsize": HEADER_SIZE,
+    }
+)
+
+
+def record_dtype(width: int) -> np.dtype:
+    return np.dtype(
+        [
+            ("index", "<i8"),
+            ("timestamp", "<f8"),
+            ("length", "<u4"),
+            ("samples", "<u2", (int(width),)),
+        ],
+        align=True,
+    )
+
+
+class WaveformArchiveWriter:
+    """Дописывает осциллограммы в архив; существующий архив продолжается."""
+
+    def __init__(self, path: str | Path, width: int = DEFAULT_WIDTH, capacity: int = DEFAULT_CAPACITY) -> None:
+        self.path = Path(path)
+        if self.path.exists() and self.path.stat().st_size >= HEADER_SIZE:
+            header = np.fromfile(self.path, dtype=HEADER_DTYPE, count=1)[0]
+            _check_magic(header, self.path)
+            self.width = int(header["width"])
+            fitting = (self.path.stat().st_size - HEADER_SIZE) // record_dtype(self.width).itemsize
+            self._count = min(int(header["count"]), fitting)
+        else:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.width = int(width)
+            self._count = 0
+            header = np.zeros(1, dtype=HEADER_DTYPE)
+            header["magic"] = ARCHIVE_MAGIC
+            header["width"] = self.width
+            with self.path.open("wb") as fh:
+                fh.write(header.tobytes())
+        self.dtype = record_dtype(self.width)
+        self._capacity = 0
+        self._map(max(int(capacity), self._count, 1))
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(self, index: int, samples: Sequence[int] | np.ndarray, timestamp: float | None = None) -> int:
+        """Добавить осциллограмму; возвращает номер записи. Лишние отсчеты отбрасываются."""
+        if self._count == self._capacity:
+            self._map(self._capacity * 2)
+        i = self._count
+        n = min(len(samples), self.width)
+        self._index[i] = index
+        self._timestamp[i] = time.time() if timestamp is None else timestamp
+        self._length[i] = n
+        self._samples[i, :n] = samples[:n]
+        self._samples[i, n:] = 0
+        self._count = i + 1
+        # счетчик обновляется последним: читатель не увидит недописанную запись
+        self._header_count[0] = self._count
+        return i
+
+    def flush(self) -> None:
+        self._records.flush()
+        self._header.flush()
+
+    def close(self) -> None:
+        if self._records is None:
+            return
+        self.flush()
+        self._release()
+        # хвост заранее выделенного места не нужен
+        with self.path.open("r+b") as fh:
+            fh.truncate(HEADER_SIZE + self._count * self.dtype.itemsize)
+
+    def __enter__(self) -> "WaveformArchiveWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _map(self, capacity: int) -> None:
+        if self._capacity:
+            self.flush()
+            self._release()
+        size = HEADER_SIZE + capacity * self.dtype.itemsize
+        with self.path.open("r+b") as fh:
+            if fh.seek(0, 2) < size:
+                fh.truncate(size)
+        self._header = np.memmap(self.path, dtype=HEADER_DTYPE, mode="r+", shape=(1,))
+        self._records = np.memmap(self.path, dtype=self.dtype, mode="r+", offset=HEADER_SIZE, shape=(capacity,))
+        self._capacity = capacity
+        # представления полей создаются один раз, а не на каждую запись
+        self._header_count = self._header["count"]
+        self._index = self._records["index"]
+        self._timestamp = self._records["timestamp"]
+        self._length = self._records["length"]
+        self._samples = self._records["samples"]
+
+    def _release(self) -> None:
+        self._header = self._records = None  # type: ignore[assignment]
+        self._header_count = self._index = self._timestamp = self._length = self._samples = None  # type: ignore[assignment]
+
+
+class WaveformArchiveReader:
+    """Произвольный доступ к записям архива только для чтения."""
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        header = np.fromfile(self.path, dtype=HEADER_DTYPE, count=1)
+        if not header.size:
+            raise ValueError(f"Waveform archive is empty: {self.path}")
+        _check_magic(header[0], self.path)
+        self.width = int(header[0]["width"])
+        self.dtype = record_dtype(self.width)
+        # запись могла оборваться на середине - берем только целые записи
+        fitting = (self.path.stat().st_size - HEADER_SIZE) // self.dtype.itemsize
+        count = min(int(header[0]["count"]), fitting)
+        self.records = (
+            np.memmap(self.path, dtype=self.dtype, mode="r", offset=HEADER_SIZE, shape=(count,))
+            if count
+            else np.zeros(0, dtype=self.dtype)
+        )
+
+    def __len__(self) -> int:
+        return int(self.records.shape[0])
+
+    def __getitem__(self, i: int) -> tuple[int, float, np.ndarray]:
+        """(номер импульса, время захвата, отсчеты) записи i."""
+        record = self.records[i]
+        return int(record["index"]), float(record["timestamp"]), record["samples"][: int(record["length"])]
+
+    @property
+    def index(self) -> np.ndarray:
+        return self.records["index"]
+
+    @property
+    def timestamp(self) -> np.ndarray:
+        return self.records["timestamp"]
+
+    @property
+    def samples(self) -> np.ndarray:
+        """Все отсчеты (записи x width); короткие записи дополнены нулями."""
+        return self.records["samples"]
+
+
+def _check_magic(header: np.void, path: Path) -> None:
+    if bytes(header["magic"]) != ARCHIVE_MAGIC:
+        raise ValueError(f"Not a waveform archive: {path}")
@@ -0,0 +1,100 @@
+"""
+Усреднение осциллограмм МПП и выделение параметров импульса.
+
+Ответ read_oscill (16-битные слова big endian, значащие 12 бит АЦП)
+декодируется сразу в массив numpy без поштучного разбора. Последние
+depth захватов хранятся в кольцевом буфере с текущей суммой, так что
+среднее обновляется за O(width) на захват. Параметры импульса - базовая
+линия (медиана начальных отсчетов), амплитуда и положение пика над ней,
+площадь над базовой линией - считаются векторно сразу по пачке захватов.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+
+ADC_MASK = 0x0FFF
+BASELINE_SAMPLES = 16
+
+
+def raw_words(raw: bytes) -> np.ndarray:
+    """16-битные слова ответа МПП без копирования (представление над bytes)."""
+    return np.frombuffer(raw, dtype=">u2", count=len(raw) // 2)
+
+
+def decode_waveform(raw: bytes, out: np.ndarray | None = None) -> np.ndarray:
+    """Отсчеты АЦП из ответа МПП; out - готовый массив uint16 под результат."""
+    return np.bitwise_and(raw_words(raw), ADC_MASK, out=out, dtype=np.uint16)
+
+
+@dataclass(frozen=True)
+class WaveformFeatures:
+    """Параметры захватов: массивы одной длины, по элементу на захват."""
+
+    baseline: np.ndarray
+    amplitude: np.ndarray
+    position: np.ndarray
+    area: np.ndarray
+
+    def __len__(self) -> int:
+        return int(self.baseline.size)
+
+
+def extract_features(frames: np.ndarray, baseline_samples: int = BASELINE_SAMPLES) -> WaveformFeatures:
+    """Параметры импульса для одного захвата (width,) или пачки (n, width)."""
+    y = np.atleast_2d(np.asarray(frames, dtype=np.float64))
+    head = max(1, min(int(baseline_samples), y.shape[1]))
+    baseline = np.median(y[:, :head], axis=1)
+    signal = y - baseline[:, None]
+    position = np.argmax(signal, axis=1)
+    amplitude = np.take_along_axis(signal, position[:, None], axis=1)[:, 0]
+    area = np.clip(signal, 0.0, None).sum(axis=1)
+    return WaveformFeatures(baseline, amplitude, position, area)
+
+
+class WaveformAverager:
+    """Скользящее среднее по последним depth захватам одной ширины.
+
+    Захват другой ширины начинает усреднение заново.
+    """
+
+    def __init__(self, depth: int = 16) -> None:
+        self.depth = max(1, int(depth))
+        self.width = 0
+        self._frames = np.zeros((self.depth, 0), dtype=np.float64)
+        self._sum = np.zeros(0, dtype=np.float64)
+        self._head = 0
+        self._count = 0
+        self.total = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def reset(self, width: int = 0) -> None:
+        self.width = int(width)
+        self._frames = np.zeros((self.depth, self.width), dtype=np.float64)
+        self._sum = np.zeros(self.width, dtype=np.float64)
+        self._head = 0
+        self._count = 0
+
+    def push(self, frame: np.ndarray) -> None:
+        if frame.shape[-1] != self.width:
+            self.reset(frame.shape[-1])
+        slot = self._frames[self._head]
+        # вытесняемый захват вычитается из суммы, новый занимает его место
+        self._sum -= slot
+        slot[:] = frame
+        self._sum += slot
+        self._head = (self._head + 1) % self.depth
+        self._count = min(self._count + 1, self.depth)
+        self.total += 1
+
+    @property
+    def mean(self) -> np.ndarray:
+        if not self._count:
+            return np.zeros(self.width, dtype=np.float64)
+        return self._sum / self._count
+
+    @property
+    def frames(self) -> np.ndarray:
+        """Захваты в буфере (порядок не хронологический)."""
+        return self._frames if self._count == self.depth else self._frames[: self._count]